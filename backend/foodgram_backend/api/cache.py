@@ -0,0 +1,99 @@
+import time
+from hashlib import md5
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+
+from recipes.changes import FEED_KEY, get_key, get_many
+from .metrics import record_cache
+from recipes.models import Ingredients, Recipes, Tags
+
+User = get_user_model()
+
+
+def get_cache():
+    return caches[settings.RECIPES_PAGE_CACHE]
+
+
+def get_page_key(request):
+    """
+    Ключ страницы по адресу сайта и нормализованной строке запроса.
+
+    Адрес входит в ключ, потому что ссылки на странице абсолютные.
+    """
+    params = sorted(
+        (key, sorted(values))
+        for key, values in request.query_params.lists()
+    )
+    query = urlencode(params, doseq=True)
+    url = f'{request.build_absolute_uri("/")}?{query}'
+    return f'recipes:page:{md5(url.encode()).hexdigest()}'
+
+
+def get_feed_keys(request):
+    """Ключи версий, от которых зависит любая страница ленты."""
+    keys = [FEED_KEY]
+    if request.query_params.get('search'):
+        # Правка любого рецепта или ингредиента может изменить выдачу.
+        keys.extend((get_key(Recipes), get_key(Ingredients)))
+    return keys
+
+
+def get_object_keys(data):
+    """Ключи версий рецептов на странице, их авторов и тэгов."""
+    keys = set()
+    for recipe in data['results']:
+        keys.add(get_key(Recipes, recipe['id']))
+        keys.add(get_key(User, recipe['author']['id']))
+        keys.update(get_key(Tags, tag['id']) for tag in recipe['tags'])
+    return sorted(keys)
+
+
+def get_page(request):
+    """
+    Страница ленты из кэша или None.
+
+    Вместе со страницей хранятся версии её зависимостей: лента целиком,
+    рецепты на странице, их авторы и тэги. Если хоть одна версия
+    изменилась, страница считается устаревшей.
+    """
+    entry = get_cache().get(get_page_key(request))
+    data = None
+    if entry is not None:
+        data, versions = entry
+        if get_many(list(versions)) != versions:
+            data = None
+    record_cache('recipes_page', data is not None)
+    return data
+
+
+def get_snapshot(request):
+    """
+    Версии ленты и время начала чтения, берутся до запросов в базу.
+
+    Запись, закоммиченная после чтения версий, поменяет их, и страница,
+    собранная по старым данным, не будет считаться свежей.
+    """
+    return time.time(), get_many(get_feed_keys(request))
+
+
+def set_page(request, data, snapshot):
+    """
+    Кэширует страницу с версиями из get_snapshot и версиями объектов.
+
+    Объекты на странице известны только после чтения, поэтому если
+    хоть один из них изменился после его начала, страница могла
+    попасть в кэш старой и не кэшируется. Время изменения пишут
+    разные процессы, часы серверов должны быть синхронизированы.
+    """
+    started, versions = snapshot
+    objects = get_many(get_object_keys(data))
+    if any(changed >= started for _, changed in objects.values()):
+        return
+    get_cache().set(
+        get_page_key(request),
+        (data, {**versions, **objects}),
+        settings.RECIPES_PAGE_CACHE_TIMEOUT
+    )
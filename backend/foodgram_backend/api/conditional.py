@@ -0,0 +1,46 @@
+from datetime import datetime, timezone
+from hashlib import md5
+
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
+
+from recipes.changes import get_key, get_many
+
+
+def conditional(*models, user_keys=()):
+    """
+    Условный GET (ETag, Last-Modified, 304) для методов вьюсета.
+
+    Валидаторы считаются по версиям таблиц, от которых зависит ответ,
+    без рендеринга тела. Для авторизованного пользователя в них входят
+    также его id и версии по ключам user_keys — функциям от id
+    пользователя, так что чужие изменения его валидаторы не сбрасывают.
+    """
+
+    def get_request_versions(request):
+        keys = [get_key(model) for model in models]
+        if request.user.is_authenticated:
+            keys.extend(
+                get_user_key(request.user.pk) for get_user_key in user_keys
+            )
+        versions = get_many(keys)
+        return [versions[key] for key in keys]
+
+    def etag(request, *args, **kwargs):
+        tokens = [token for token, _ in get_request_versions(request)]
+        tokens.append(str(request.user.pk))
+        return md5(':'.join(tokens).encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        changed = max(changed for _, changed in get_request_versions(request))
+        return datetime.fromtimestamp(changed, tz=timezone.utc)
+
+    def decorator(func):
+        func = condition(etag_func=etag, last_modified_func=last_modified)(
+            func
+        )
+        if user_keys:
+            func = vary_on_headers('Authorization')(func)
+        return func
+
+    return decorator
@@ -1,12 +1,20 @@
 from django_filters import rest_framework as filter
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import BaseFilterBackend
 
 from recipes.models import Recipes, Tags
+from recipes.search import search_ingredients, search_recipes
 
 
-class IngredientFilter(SearchFilter):
+class IngredientFilter(BaseFilterBackend):
+    """Автодополнение ингредиентов по началу и по части названия."""
     search_param = 'name'
 
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(self.search_param, '').strip()
+        if not name:
+            return queryset
+        return search_ingredients(queryset, name)
+
 
 class RecipeFilter(filter.FilterSet):
     author = filter.CharFilter()
@@ -19,10 +27,17 @@ class RecipeFilter(filter.FilterSet):
     is_favorited = filter.BooleanFilter(method='get_favorite')
     is_in_shopping_cart = filter.BooleanFilter(
         method='get_is_in_shopping_cart')
+    search = filter.CharFilter(method='get_search')
 
     class Meta:
         model = Recipes
-        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart']
+        fields = [
+            'tags',
+            'author',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'search'
+        ]
 
     def get_favorite(self, queryset, name, value):
         if value:
@@ -33,3 +48,14 @@ class RecipeFilter(filter.FilterSet):
         if value:
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
+
+    def get_search(self, queryset, name, value):
+        """
+        Полнотекстовый поиск с сортировкой по релевантности.
+
+        С ?cursor= KeysetPagination сортирует найденное в порядке ленты.
+        """
+        value = value.strip()
+        if not value:
+            return queryset
+        return search_recipes(queryset, value)
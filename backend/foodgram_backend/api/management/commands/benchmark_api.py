@@ -0,0 +1,170 @@
+import base64
+import statistics
+import time
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredients, Recipes, Tags
+
+User = get_user_model()
+
+
+def get_image():
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), 'white').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the main API endpoints through the Django test client '
+        'and report latency percentiles and query counts. Writes are '
+        'rolled back, uploaded images stay in MEDIA_ROOT'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=50,
+            help='requests per endpoint'
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=3,
+            help='untimed requests per endpoint'
+        )
+        parser.add_argument(
+            '--user',
+            help='username to authenticate as, the user with the most '
+                 'subscriptions by default'
+        )
+
+    def get_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+        else:
+            user = User.objects.annotate(
+                subscriptions=Count('follower')
+            ).order_by('-subscriptions', 'pk').first()
+        if user is None:
+            raise CommandError('No users, run seed_data first')
+        return user
+
+    def get_endpoints(self, user):
+        tag = Tags.objects.values_list('slug', flat=True).first()
+        author = Recipes.objects.values_list('author_id', flat=True).first()
+        ingredients = list(
+            Ingredients.objects.order_by('pk').values_list('pk', flat=True)[:5]
+        )
+        payload = {
+            'ingredients': [
+                {'id': pk, 'amount': 10 * num}
+                for num, pk in enumerate(ingredients, 1)
+            ],
+            'tags': list(Tags.objects.values_list('pk', flat=True)[:2]),
+            'image': get_image(),
+            'name': 'Тестовый рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+        }
+        return [
+            ('recipes, anonymous', False, 'get', '/api/recipes/', None),
+            ('recipes', True, 'get', '/api/recipes/', None),
+            ('recipes, page 10', True, 'get', '/api/recipes/?page=10', None),
+            ('recipes, tags', True, 'get', f'/api/recipes/?tags={tag}', None),
+            (
+                'recipes, author', True, 'get',
+                f'/api/recipes/?author={author}', None
+            ),
+            (
+                'recipes, favorited', True, 'get',
+                '/api/recipes/?is_favorited=1', None
+            ),
+            (
+                'recipes, in cart', True, 'get',
+                '/api/recipes/?is_in_shopping_cart=1', None
+            ),
+            (
+                'subscriptions', True, 'get',
+                '/api/users/subscriptions/?recipes_limit=3', None
+            ),
+            (
+                'download cart', True, 'get',
+                '/api/recipes/download_shopping_cart/', None
+            ),
+            ('create recipe', True, 'post', '/api/recipes/', payload),
+        ]
+
+    def request(self, client, method, url, payload):
+        # Запись откатывается, чтобы прогоны не меняли данные.
+        with transaction.atomic():
+            response = getattr(client, method)(url, payload, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+            transaction.set_rollback(True)
+        if response.status_code >= 400:
+            raise CommandError(
+                f'{method.upper()} {url}: {response.status_code}'
+            )
+        return response
+
+    def run(self, client, method, url, payload, count):
+        timings, queries = [], []
+        for _ in range(count):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                self.request(client, method, url, payload)
+                timings.append(time.perf_counter() - started)
+            # Без SAVEPOINT/RELEASE от отката записи.
+            queries.append(len([
+                query for query in context.captured_queries
+                if 'SAVEPOINT' not in query['sql']
+            ]))
+        return timings, queries
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be positive')
+        setup_test_environment()
+        user = self.get_user(options['user'])
+        anonymous, authenticated = APIClient(), APIClient()
+        authenticated.force_authenticate(user)
+        self.stdout.write(
+            f'{connection.vendor}, user {user.username}, '
+            f'{options["requests"]} requests per endpoint'
+        )
+        self.stdout.write(
+            f'{"endpoint":<22}{"p50 ms":>9}{"p90 ms":>9}{"p99 ms":>9}'
+            f'{"max ms":>9}{"queries":>9}'
+        )
+        for name, auth, method, url, payload in self.get_endpoints(user):
+            client = authenticated if auth else anonymous
+            self.run(client, method, url, payload, options['warmup'])
+            timings, queries = self.run(
+                client, method, url, payload, options['requests']
+            )
+            if len(timings) > 1:
+                p50, p90, p99 = (
+                    statistics.quantiles(
+                        timings, n=100, method='inclusive'
+                    )[num]
+                    for num in (49, 89, 98)
+                )
+            else:
+                p50 = p90 = p99 = timings[0]
+            self.stdout.write(
+                f'{name:<22}{p50 * 1e3:>9.1f}{p90 * 1e3:>9.1f}'
+                f'{p99 * 1e3:>9.1f}{max(timings) * 1e3:>9.1f}'
+                f'{max(queries):>9}'
+            )
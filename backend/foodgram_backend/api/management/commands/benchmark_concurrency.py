@@ -0,0 +1,133 @@
+import random
+import socket
+import statistics
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Load a running server with concurrent slow clients to compare '
+        'the sync (WSGI) and async (ASGI=True) gunicorn deployments'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            default='http://127.0.0.1:8000',
+            help='server address'
+        )
+        parser.add_argument(
+            '--path',
+            default='/api/users/me/',
+            help='endpoint to request'
+        )
+        parser.add_argument('--method', default='GET')
+        parser.add_argument(
+            '--user',
+            help='username to issue a token for, the first user by default'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=50,
+            help='simultaneous clients'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=4,
+            help='requests per client'
+        )
+        parser.add_argument(
+            '--client-delay',
+            type=float,
+            default=0.5,
+            help='maximum seconds a client waits between sending the '
+                 'request line and the headers, each request waits a random '
+                 'time up to it'
+        )
+
+    def get_token(self, username):
+        users = User.objects.order_by('pk')
+        if username:
+            users = users.filter(username=username)
+        user = users.first()
+        if user is None:
+            raise CommandError('No such user')
+        return str(RefreshToken.for_user(user).access_token)
+
+    def send(self, options, token):
+        """Один запрос медленного клиента, возвращает код ответа."""
+        address = urlsplit(options['url'])
+        with socket.create_connection(
+            (address.hostname, address.port or 80), timeout=60
+        ) as sock:
+            sock.sendall(
+                f'{options["method"]} {options["path"]} HTTP/1.1\r\n'.encode()
+            )
+            time.sleep(random.uniform(0, options['client_delay']))
+            sock.sendall((
+                f'Host: {address.netloc}\r\n'
+                f'Authorization: Token {token}\r\n'
+                'Content-Length: 0\r\n'
+                'Connection: close\r\n\r\n'
+            ).encode())
+            response = b''
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                response += chunk
+        return int(response.split(b' ', 2)[1])
+
+    def client(self, options, token, results):
+        for _ in range(options['requests']):
+            started = time.perf_counter()
+            try:
+                status = self.send(options, token)
+            except (OSError, IndexError, ValueError):
+                status = None
+            results.append((status, time.perf_counter() - started))
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be positive')
+        token = self.get_token(options['user'])
+        results = []
+        threads = [
+            threading.Thread(
+                target=self.client, args=(options, token, results)
+            )
+            for _ in range(options['concurrency'])
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        timings = [duration for _, duration in results]
+        statuses = Counter(status for status, _ in results)
+        if len(timings) > 1:
+            p50, p90, p99 = (
+                statistics.quantiles(timings, n=100, method='inclusive')[num]
+                for num in (49, 89, 98)
+            )
+        else:
+            p50 = p90 = p99 = timings[0]
+        self.stdout.write(
+            f'{len(results)} requests from {options["concurrency"]} clients '
+            f'in {elapsed:.1f} s, {len(results) / elapsed:.1f} req/s\n'
+            f'latency p50 {p50 * 1e3:.0f} ms, p90 {p90 * 1e3:.0f} ms, '
+            f'p99 {p99 * 1e3:.0f} ms\n'
+            f'statuses: {dict(statuses)}'
+        )
@@ -0,0 +1,56 @@
+import base64
+import os
+import time
+import tracemalloc
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+
+from api.uploads import decode_base64_image
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def decode_whole(data):
+    """Прежний способ: split и b64decode всей строки."""
+    format, imgstr = data.split(';base64,')
+    ext = format.split('/')[-1]
+    return ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+
+
+class Command(BaseCommand):
+    help = 'Compare peak memory of whole and chunked base64 image decoding'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[10, 20],
+            help='decoded image sizes in MB'
+        )
+
+    def measure(self, decode, data):
+        tracemalloc.start()
+        started = time.perf_counter()
+        file = decode(data)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        file.close()
+        return peak, elapsed
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            raw = PNG_SIGNATURE + os.urandom(size * 1024 * 1024 - 8)
+            data = 'data:image/png;base64,' + base64.b64encode(raw).decode()
+            del raw
+            for label, decode in (
+                ('whole', decode_whole),
+                ('chunked', decode_base64_image)
+            ):
+                peak, elapsed = self.measure(decode, data)
+                self.stdout.write(
+                    f'{size} MB {label}: peak {peak / 2 ** 20:.1f} MB '
+                    f'over the request body, {elapsed * 1e3:.0f} ms'
+                )
@@ -0,0 +1,108 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from django.test.utils import setup_test_environment
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.fast_serializers import RECIPE_FIELDS, build_recipe, get_related
+from api.serializers import RecipesSerializer, get_membership
+from recipes.models import RecipeIngredient, Recipes
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare per-recipe serialization cost of RecipesSerializer and '
+        'the values()-based fast serializer on recipes from the database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=100,
+            help='recipes to serialize'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='serialization passes'
+        )
+        parser.add_argument(
+            '--user',
+            help='username for the flags, anonymous by default'
+        )
+
+    def get_request(self, username):
+        request = APIRequestFactory().get('/api/recipes/')
+        if username:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f'No user {username}')
+            force_authenticate(request, user)
+        request = Request(request)
+        request.user
+        return request
+
+    def measure(self, serialize, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            data = serialize()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, data
+
+    def handle(self, *args, **options):
+        if options['recipes'] < 1 or options['repeat'] < 1:
+            raise CommandError('--recipes and --repeat must be positive')
+        setup_test_environment()
+        request = self.get_request(options['user'])
+        recipes = list(Recipes.objects.select_related(
+            'author'
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            )
+        )[:options['recipes']])
+        if not recipes:
+            raise CommandError('No recipes, run seed_data first')
+        rows = list(
+            Recipes.objects.values(*RECIPE_FIELDS)[:options['recipes']]
+        )
+        tags, ingredients = get_related([row['id'] for row in rows])
+        context = {'request': request, 'image_rendition': 'card'}
+        member = get_membership(context)
+
+        drf, drf_data = self.measure(
+            lambda: RecipesSerializer(
+                recipes, many=True, context=context
+            ).data,
+            options['repeat']
+        )
+        fast, fast_data = self.measure(
+            lambda: [
+                build_recipe(row, tags, ingredients, member, request, 'card')
+                for row in rows
+            ],
+            options['repeat']
+        )
+        count = len(recipes)
+        self.stdout.write(
+            f'{count} recipes, best of {options["repeat"]} passes\n'
+            f'RecipesSerializer: {drf / count * 1e6:.1f} us per recipe\n'
+            f'fast serializer:   {fast / count * 1e6:.1f} us per recipe\n'
+            f'speedup: {drf / fast:.1f}x'
+        )
+        renderer = JSONRenderer()
+        if renderer.render(drf_data) != renderer.render(fast_data):
+            raise CommandError('Serialized JSON differs')
+        self.stdout.write(self.style.SUCCESS('JSON is identical'))
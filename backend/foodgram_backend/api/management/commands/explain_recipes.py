@@ -0,0 +1,67 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Recipes, Tags
+
+User = get_user_model()
+
+# Полный просмотр таблицы рецептов без индекса.
+FULL_SCAN = re.compile(
+    r'Seq Scan on recipes_recipes\b|SCAN recipes_recipes(?! USING)'
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Print EXPLAIN plans of the recipe feed filters and fail '
+        'if one of them scans the recipes table without an index'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            help='user id for the favorites, cart and author filters, '
+                 'the first user by default'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=6,
+            help='page size'
+        )
+
+    def get_cases(self, user, tag):
+        recipes = Recipes.objects.all()
+        return {
+            'feed': recipes,
+            'author': recipes.filter(author=user),
+            'tags': recipes.filter(tags__slug__in=[tag]).distinct(),
+            'author + tags': recipes.filter(
+                author=user, tags__slug__in=[tag]
+            ).distinct(),
+            'is_favorited': recipes.filter(favorites__user=user),
+            'is_in_shopping_cart': recipes.filter(shopping_cart__user=user),
+            'subscriptions': User.objects.filter(author__user=user),
+        }
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['user'] is not None:
+            users = users.filter(pk=options['user'])
+        user = users.first()
+        tag = Tags.objects.values_list('slug', flat=True).first()
+        if user is None or tag is None:
+            raise CommandError('Need at least one user and one tag')
+        failed = []
+        for name, queryset in self.get_cases(user, tag).items():
+            plan = queryset[:options['limit']].explain()
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(plan)
+            if FULL_SCAN.search(plan):
+                failed.append(name)
+        if failed:
+            raise CommandError(f'Full scan in: {", ".join(failed)}')
+        self.stdout.write(self.style.SUCCESS('All queries use indexes'))
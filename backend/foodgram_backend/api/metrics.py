@@ -0,0 +1,64 @@
+import os
+
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess
+)
+
+REQUESTS = Counter(
+    'foodgram_http_requests_total',
+    'HTTP requests by route and status',
+    ['method', 'route', 'status']
+)
+LATENCY = Histogram(
+    'foodgram_http_request_duration_seconds',
+    'HTTP request latency by route',
+    ['method', 'route']
+)
+DB_QUERIES = Histogram(
+    'foodgram_db_queries_per_request',
+    'SQL queries per request by route',
+    ['route'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, float('inf'))
+)
+DB_TIME = Counter(
+    'foodgram_db_duration_seconds_total',
+    'Time spent in SQL queries by route',
+    ['route']
+)
+CACHE = Counter(
+    'foodgram_cache_requests_total',
+    'Cache lookups by cache and result',
+    ['cache', 'result']
+)
+
+
+def record_cache(cache, hit):
+    CACHE.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def get_registry():
+    """
+    Реестр для выдачи.
+
+    Под gunicorn с PROMETHEUS_MULTIPROC_DIR каждый воркер пишет метрики
+    в свои файлы в этом каталоге, и выдача собирает их все.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics(request):
+    """Метрики в текстовом формате Prometheus."""
+    return HttpResponse(
+        generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST
+    )
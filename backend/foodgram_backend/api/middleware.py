@@ -0,0 +1,176 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework import serializers
+
+from .metrics import DB_QUERIES, DB_TIME, LATENCY, REQUESTS
+
+logger = logging.getLogger(__name__)
+
+_stats = ContextVar('request_stats', default=None)
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.templates = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        """Обёртка выполнения запросов, см. connection.execute_wrapper."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.templates[IN_LIST.sub('IN (...)', sql)] += 1
+
+    def get_repeated(self, threshold):
+        """Одинаковые запросы, повторённые не меньше threshold раз."""
+        return [
+            {'sql': sql, 'count': count}
+            for sql, count in self.templates.most_common()
+            if count >= threshold
+        ]
+
+
+def timed_data(prop):
+    """Считает время сериализации по внешнему вызову .data."""
+    def data(self):
+        stats = _stats.get()
+        if stats is None:
+            return prop.fget(self)
+        stats.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return prop.fget(self)
+        finally:
+            stats.serializer_depth -= 1
+            if not stats.serializer_depth:
+                stats.serializer_time += time.perf_counter() - started
+    return property(data)
+
+
+def patch_serializers():
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        if not getattr(cls.data.fget, 'timed', False):
+            cls.data = timed_data(cls.data)
+            cls.data.fget.timed = True
+
+
+def count_queries(stats):
+    """Подключает подсчёт запросов stats ко всем соединениям."""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(stats))
+    return stack
+
+
+def get_route(request):
+    """Шаблон URL из urls.py, по которому разрешился запрос."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.route
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    return getattr(match.func, 'cls', match.func).__name__
+
+
+class InstrumentationMiddleware:
+    """
+    Замеры запроса: число SQL-запросов, время в базе и в сериализаторах,
+    размер ответа.
+
+    Включается REQUEST_INSTRUMENTATION = True. Замеры отдаются
+    в заголовке Server-Timing и строкой JSON в лог api.middleware,
+    повторяющиеся одинаковые запросы (N+1) пишутся предупреждением.
+    Запросы потоковых ответов, выполняемые после выхода из вьюхи,
+    не учитываются.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        patch_serializers()
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _stats.set(stats)
+        started = time.perf_counter()
+        try:
+            with count_queries(stats):
+                response = self.get_response(request)
+        finally:
+            _stats.reset(token)
+        total = time.perf_counter() - started
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={stats.db_time * 1e3:.1f};desc="{stats.queries} queries"',
+            f'serializer;dur={stats.serializer_time * 1e3:.1f}',
+            f'total;dur={total * 1e3:.1f}',
+        ))
+        view = get_view_name(request)
+        repeated = stats.get_repeated(settings.N_PLUS_ONE_THRESHOLD)
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'queries': stats.queries,
+            'db_ms': round(stats.db_time * 1e3, 1),
+            'serializer_ms': round(stats.serializer_time * 1e3, 1),
+            'total_ms': round(total * 1e3, 1),
+            'size': None if response.streaming else len(response.content),
+            'repeated_queries': len(repeated),
+        }, ensure_ascii=False))
+        for query in repeated:
+            logger.warning(
+                'Possible N+1 in %s: %d x %s', view, query['count'],
+                query['sql']
+            )
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Метрики Prometheus по шаблонам URL: число запросов, задержка,
+    SQL-запросы и время в базе.
+
+    Включается PROMETHEUS_METRICS = True, выдача — на /metrics.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROMETHEUS_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        started = time.perf_counter()
+        with count_queries(stats):
+            response = self.get_response(request)
+        route = get_route(request)
+        REQUESTS.labels(request.method, route, response.status_code).inc()
+        LATENCY.labels(request.method, route).observe(
+            time.perf_counter() - started
+        )
+        DB_QUERIES.labels(route).observe(stats.queries)
+        DB_TIME.labels(route).inc(stats.db_time)
+        return response
@@ -1,6 +1,189 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Постраничная выдача по курсору.
+
+    Курсор хранит значения полей сортировки последнего (или первого)
+    объекта страницы, следующая страница выбирается условием по ним,
+    поэтому стоимость запроса не зависит от глубины. Общее число
+    объектов считается только по запросу с ?count=true.
+    Поля сортировки берутся из атрибута вьюсета cursor_ordering.
+    """
+    page_size = 6
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Некорректный курсор.'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return page_size if page_size > 0 else self.page_size
+
+    def get_ordering(self, view):
+        return getattr(view, 'cursor_ordering', self.ordering)
+
+    def encode_cursor(self, reverse, position):
+        cursor = json.dumps([reverse, position], default=str)
+        return urlsafe_b64encode(cursor.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+        try:
+            reverse, position = json.loads(urlsafe_b64decode(encoded))
+            if len(position) != len(self.fields):
+                raise ValueError
+            position = [
+                self.model._meta.get_field(name.lstrip('-')).to_python(value)
+                for name, value in zip(self.fields, position)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return bool(reverse), position
+
+    def get_position(self, instance):
+        """Значения полей сортировки объекта или строки .values()."""
+        if isinstance(instance, dict):
+            return [instance[name.lstrip('-')] for name in self.fields]
+        return [getattr(instance, name.lstrip('-')) for name in self.fields]
+
+    def get_filter(self, position, reverse):
+        """Условие «строго после position» для составного ключа."""
+        conditions = []
+        for num, name in enumerate(self.fields):
+            field = name.lstrip('-')
+            descending = name.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            equal = {
+                other.lstrip('-'): value
+                for other, value in zip(self.fields[:num], position)
+            }
+            equal[f'{field}__{lookup}'] = position[num]
+            conditions.append(Q(**equal))
+        return reduce(or_, conditions)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.model = queryset.model
+        self.fields = self.get_ordering(view)
+        self.count = None
+        if request.query_params.get(self.count_query_param) in (
+            '1', 'true', 'True'
+        ):
+            self.count = queryset.count()
+        page_size = self.get_page_size(request)
+        reverse, position = self.decode_cursor(request)
+        ordering = self.fields
+        if reverse:
+            ordering = [
+                name[1:] if name.startswith('-') else f'-{name}'
+                for name in ordering
+            ]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_filter(position, reverse))
+        page = list(queryset[:page_size + 1])
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        if reverse:
+            page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        self.page = page
+        return page
+
+    def get_link(self, reverse, instance):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'page')
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            self.encode_cursor(reverse, self.get_position(instance))
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.get_link(False, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.get_link(True, self.page[0])
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
 
 
 class CustomPagination(PageNumberPagination):
+    """
+    Постраничная выдача по номеру страницы (?page=, ?limit=).
+
+    С параметром ?cursor= (в том числе пустым) переключается
+    на KeysetPagination.
+    """
+    page_size_query_param = 'limit'
+    page_size = 6
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if KeysetPagination.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class IngredientSearchPagination(BasePagination):
+    """Ограничивает выдачу автодополнения, не меняя формат ответа."""
+    search_param = 'name'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not request.query_params.get(self.search_param):
+            return None
+        return list(queryset[:settings.INGREDIENTS_SEARCH_LIMIT])
+
+    def get_paginated_response(self, data):
+        return Response(data)
+
+
+class CookablePagination(PageNumberPagination):
+    """
+    Постраничная выдача «что приготовить» (?page=, ?limit=).
+
+    Работает со списком Ranking, который сортирует только нужный срез.
+    """
     page_size_query_param = 'limit'
     page_size = 6
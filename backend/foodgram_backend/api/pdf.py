@@ -0,0 +1,166 @@
+"""
+Потоковая запись PDF для списка покупок.
+
+Кодирование текста и подмножества шрифтов берутся из внутренностей
+reportlab.pdfbase.ttfonts: TTFont.splitString, TTFont.state,
+_assignState и TTFontFile.makeSubset. Это не публичный API, код
+проверен с reportlab 4.0.4, закреплённой в requirements.txt, и при
+обновлении reportlab его нужно проверить заново.
+"""
+import zlib
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase.ttfonts import (
+    FF_NONSYMBOLIC,
+    FF_SYMBOLIC,
+    SUBSETN,
+    makeToUnicodeCMap
+)
+
+# Объекты, номера которых нужны страницам до того, как они записаны.
+CATALOG, PAGES, RESOURCES = 1, 2, 3
+
+
+class StreamingPDF:
+    """
+    PDF, который отдаётся по частям по мере готовности страниц.
+
+    reportlab.Canvas держит документ в памяти до save(), здесь каждая
+    страница пишется сразу, а в памяти остаются только смещения
+    объектов для таблицы xref. Текст набирается шрифтом TrueType
+    подмножествами по 256 символов, как в reportlab; сами
+    подмножества, дерево страниц и xref пишутся в finish().
+    """
+
+    def __init__(self, font, font_size, page_size=A4):
+        self.font = font
+        self.font_size = font_size
+        self.page_size = page_size
+        self.offsets = [None] * RESOURCES
+        self.position = 0
+        self.pages = []
+
+    def emit(self, data):
+        self.position += len(data)
+        return data
+
+    def reserve(self):
+        self.offsets.append(None)
+        return len(self.offsets)
+
+    def write_object(self, number, body):
+        """Объект с телом body: bytes или строка из ASCII."""
+        if isinstance(body, str):
+            body = body.encode('latin-1')
+        self.offsets[number - 1] = self.position
+        return self.emit(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+
+    def write_stream(self, number, data, extra=''):
+        data = zlib.compress(data)
+        header = f'<< /Length {len(data)} /Filter /FlateDecode{extra} >>'
+        return self.write_object(number, b'%s\nstream\n%s\nendstream' % (
+            header.encode('latin-1'), data
+        ))
+
+    def start(self):
+        return self.emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def encode(self, text):
+        """Команды вывода строки: шрифт подмножества и коды символов."""
+        return ' '.join(
+            f'/F{subset} {self.font_size} Tf <{codes.hex()}> Tj'
+            for subset, codes in self.font.splitString(text, self)
+        )
+
+    def page(self, lines):
+        """Страница из строк (x, y, текст)."""
+        content = '\n'.join(
+            f'BT 1 0 0 1 {x} {y} Tm {self.encode(text)} ET'
+            for x, y, text in lines
+        )
+        contents = self.reserve()
+        page = self.reserve()
+        self.pages.append(page)
+        width, height = self.page_size
+        return self.write_stream(
+            contents, content.encode('latin-1')
+        ) + self.write_object(
+            page,
+            f'<< /Type /Page /Parent {PAGES} 0 R '
+            f'/MediaBox [0 0 {width} {height}] '
+            f'/Resources {RESOURCES} 0 R /Contents {contents} 0 R >>'
+        )
+
+    def write_font(self, number, subset, fonts):
+        """
+        Подмножество шрифта: файл, описание, ToUnicode и сам шрифт,
+        ссылка на который добавляется в fonts.
+        """
+        face = self.font.face
+        name = (SUBSETN(number) + b'+' + face.name).decode('latin-1')
+        font_file = face.makeSubset(subset)
+        font_file_number = self.reserve()
+        yield self.write_stream(
+            font_file_number, font_file, f' /Length1 {len(font_file)}'
+        )
+        descriptor = self.reserve()
+        flags = face.flags & ~FF_NONSYMBOLIC | FF_SYMBOLIC
+        bbox = ' '.join(map(str, face.bbox))
+        yield self.write_object(
+            descriptor,
+            f'<< /Type /FontDescriptor /FontName /{name} /Flags {flags} '
+            f'/FontBBox [{bbox}] /ItalicAngle {face.italicAngle} '
+            f'/Ascent {face.ascent} /Descent {face.descent} '
+            f'/CapHeight {face.capHeight} /StemV {face.stemV} '
+            f'/FontFile2 {font_file_number} 0 R >>'
+        )
+        cmap = self.reserve()
+        yield self.write_stream(
+            cmap, makeToUnicodeCMap(name, subset).encode('latin-1')
+        )
+        font = self.reserve()
+        widths = ' '.join(str(face.getCharWidth(code)) for code in subset)
+        yield self.write_object(
+            font,
+            f'<< /Type /Font /Subtype /TrueType /BaseFont /{name} '
+            f'/FirstChar 0 /LastChar {len(subset) - 1} /Widths [{widths}] '
+            f'/FontDescriptor {descriptor} 0 R /ToUnicode {cmap} 0 R >>'
+        )
+        fonts.append(f'/F{number} {font} 0 R')
+
+    def close(self):
+        """
+        Убирает документ из общего для процесса TTFont.state,
+        не полагаясь на то, что словарь слабый и документ вовремя
+        соберёт сборщик мусора.
+        """
+        self.font.state.pop(self, None)
+
+    def finish(self):
+        """Шрифты, дерево страниц и таблица xref."""
+        fonts = []
+        state = self.font._assignState(self)
+        state.frozen = True
+        for number, subset in enumerate(state.subsets):
+            yield from self.write_font(number, subset, fonts)
+        self.close()
+        yield self.write_object(
+            RESOURCES, f'<< /Font << {" ".join(fonts)} >> >>'
+        )
+        kids = ' '.join(f'{page} 0 R' for page in self.pages)
+        yield self.write_object(
+            PAGES,
+            f'<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>'
+        )
+        yield self.write_object(
+            CATALOG, f'<< /Type /Catalog /Pages {PAGES} 0 R >>'
+        )
+        xref = self.position
+        yield self.emit(''.join((
+            f'xref\n0 {len(self.offsets) + 1}\n',
+            '0000000000 65535 f \n',
+            *(f'{offset:010d} 00000 n \n' for offset in self.offsets),
+            f'trailer\n<< /Size {len(self.offsets) + 1} '
+            f'/Root {CATALOG} 0 R >>\n',
+            f'startxref\n{xref}\n%%EOF\n'
+        )).encode('latin-1'))
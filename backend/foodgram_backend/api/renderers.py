@@ -0,0 +1,122 @@
+import csv
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from rest_framework import renderers
+
+from .pdf import StreamingPDF
+
+TITLE = 'Cписок покупок:'
+
+
+class ShoppingCartRenderer(renderers.BaseRenderer):
+    """
+    Базовый рендерер списка покупок.
+
+    Сам список отдаётся потоком через stream(), render() нужен только
+    для ответов с ошибками.
+    """
+    charset = 'utf-8'
+    extension = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = '\n'.join(f'{key}: {value}' for key, value in data.items())
+        return str(data or '').encode(self.charset or 'utf-8')
+
+    def stream(self, ingredients):
+        raise NotImplementedError
+
+
+class TXTShoppingCartRenderer(ShoppingCartRenderer):
+    """Список покупок текстом."""
+    media_type = 'text/plain'
+    format = 'txt'
+    extension = 'txt'
+
+    def stream(self, ingredients):
+        yield TITLE
+        for num, item in enumerate(ingredients):
+            if num:
+                yield ', '
+            yield (
+                f"\n{item['ingredient__name']} - "
+                f"{item['amount']} {item['ingredient__measurement_unit']}"
+            )
+
+
+class Echo:
+    """Псевдобуфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class CSVShoppingCartRenderer(ShoppingCartRenderer):
+    """Список покупок в формате csv."""
+    media_type = 'text/csv'
+    format = 'csv'
+    extension = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'amount', 'measurement_unit'))
+        for item in ingredients:
+            yield writer.writerow((
+                item['ingredient__name'],
+                item['amount'],
+                item['ingredient__measurement_unit']
+            ))
+
+
+class PDFShoppingCartRenderer(ShoppingCartRenderer):
+    """Список покупок в формате pdf."""
+    media_type = 'application/pdf'
+    charset = None
+    format = 'pdf'
+    extension = 'pdf'
+    font_name = 'DejaVuSans'
+    font_size = 12
+    margin = 50
+    line_height = 18
+
+    def register_font(self):
+        if self.font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(self.font_name, settings.SHOPPING_CART_FONT)
+            )
+
+    def stream(self, ingredients):
+        """
+        Страницы отдаются по мере заполнения, весь документ
+        в памяти не собирается, см. StreamingPDF.
+        """
+        self.register_font()
+        pdf = StreamingPDF(
+            pdfmetrics.getFont(self.font_name), self.font_size, A4
+        )
+        try:
+            yield pdf.start()
+            width, height = A4
+            y = height - self.margin
+            lines = [(self.margin, y, TITLE)]
+            for item in ingredients:
+                y -= self.line_height
+                if y < self.margin:
+                    yield pdf.page(lines)
+                    y = height - self.margin
+                    lines = []
+                lines.append((
+                    self.margin,
+                    y,
+                    f"{item['ingredient__name']} - "
+                    f"{item['amount']} {item['ingredient__measurement_unit']}"
+                ))
+            yield pdf.page(lines)
+            yield from pdf.finish()
+        finally:
+            # Клиент оборвал загрузку: генератор закрывается на yield,
+            # и finish() не доходит до конца.
+            pdf.close()
@@ -1,9 +1,9 @@
-import base64
-
 from rest_framework import serializers, validators
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.files.base import ContentFile
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 
 from recipes.models import (
     Tags,
@@ -13,7 +13,13 @@ from recipes.models import (
     Favorite,
     WishList
 )
+from recipes.catalogue import get_catalogue
+from recipes.images import RENDITIONS, get_image_url
+from recipes import cookable, membership, shopping_list
+from recipes.search import update_search_vectors
+from recipes.signals import bulk_ingredients
 from users.models import Subscription
+from .uploads import decode_base64_image
 from .validators import (
     validate_username,
     validate_email,
@@ -24,14 +30,38 @@ from .validators import (
 User = get_user_model()
 
 
+def build_image_url(recipe, rendition, request=None):
+    url = get_image_url(recipe, rendition)
+    if url is not None and request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def get_recipes_limit(request):
+    """Значение ?recipes_limit= или None, если ограничения нет."""
+    try:
+        limit = int(request.query_params.get('recipes_limit'))
+    except (TypeError, ValueError):
+        return None
+    return limit if limit >= 0 else None
+
+
+def get_membership(context):
+    """Подписки, избранное и корзина автора запроса, раз на запрос."""
+    request = context.get('request')
+    if request is None or request.user.is_anonymous:
+        return None
+    if not hasattr(request, 'membership'):
+        request.membership = membership.get_membership(request.user.pk)
+    return request.membership
+
+
 class Base64ImageField(serializers.ImageField):
     """Сериализатор кодирования изображений в Base64."""
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = decode_base64_image(data)
         return super().to_internal_value(data)
 
 
@@ -71,13 +101,10 @@ class UserSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         """Метод указывает подписан ли юзер, делающий запрос, на автора."""
-
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return Subscription.objects.filter(
-            user=request.user, author=obj
-        ).exists()
+        if hasattr(obj, 'subscribed'):
+            return obj.subscribed
+        member = get_membership(self.context)
+        return member is not None and obj.id in member.authors
 
 
 class ChangePasswordSerializer(UserSerializer):
@@ -169,7 +196,8 @@ class RecipesSerializer(serializers.ModelSerializer):
 
     author = UserSerializer(read_only=True, many=False)
     ingredients = serializers.SerializerMethodField(required=False)
-    image = serializers.ImageField(required=True)
+    image = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
     tags = TagsSerializer(read_only=True, many=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
@@ -185,29 +213,37 @@ class RecipesSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'images',
             'text',
             'cooking_time'
         )
 
+    def get_image(self, obj):
+        """Картинка в размере, заданном в контексте (по умолчанию full)."""
+        return build_image_url(
+            obj,
+            self.context.get('image_rendition', 'full'),
+            self.context.get('request')
+        )
+
+    def get_images(self, obj):
+        request = self.context.get('request')
+        return {
+            rendition: build_image_url(obj, rendition, request)
+            for rendition in RENDITIONS
+        }
+
     def get_ingredients(self, obj):
-        ingredients = RecipeIngredient.objects.filter(recipe=obj)
+        ingredients = obj.recipeingredient_set.all()
         return IngredientAmountSerializer(ingredients, many=True).data
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return Favorite.objects.filter(
-            user=request.user, recipe=obj
-        ).exists()
+        member = get_membership(self.context)
+        return member is not None and obj.id in member.favorites
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return WishList.objects.filter(
-            user=request.user, recipe=obj
-        ).exists()
+        member = get_membership(self.context)
+        return member is not None and obj.id in member.shopping_cart
 
 
 class AddIngredientRecipeSerializer(serializers.ModelSerializer):
@@ -253,10 +289,26 @@ class CreateRecipesSerializer(serializers.ModelSerializer):
             'cooking_time'
         )
 
+    def get_known_ingredients(self, ingredients):
+        """
+        Существующие id ингредиентов: справочник в памяти процесса или,
+        при INGREDIENTS_CATALOGUE_CACHE = False, один запрос по id.
+        """
+        if settings.INGREDIENTS_CATALOGUE_CACHE:
+            return get_catalogue()
+        return set(Ingredients.objects.filter(
+            id__in=[int(ingr['id']) for ingr in ingredients]
+        ).values_list('id', flat=True))
+
     def validate(self, data):
-        ingredients = self.initial_data.get('ingredients')
+        ingredients = self.initial_data.get('ingredients') or []
+        known = self.get_known_ingredients(ingredients)
         lst = []
         for ingr in ingredients:
+            if int(ingr['id']) not in known:
+                raise serializers.ValidationError({
+                    'ingredient': 'Такого ингредиента не существует!'
+                })
             amount = ingr['amount']
             if int(amount) < 1:
                 raise serializers.ValidationError({
@@ -267,17 +319,90 @@ class CreateRecipesSerializer(serializers.ModelSerializer):
                     'ingredient': 'Ингредиенты должны быть уникальными!'
                 })
             lst.append(ingr['id'])
+        if 'tags' in data and len(data['tags']) < 1:
+            raise serializers.ValidationError({
+                'tags': 'Количество тэгов должно быть больше 0!'
+            })
+        if 'ingredients' in data and len(data['ingredients']) < 1:
+            raise serializers.ValidationError({
+                'ingredients': 'Количество ингредиента должно быть больше 0!'
+            })
         return data
 
     def create_ingredients(self, ingredients, recipe):
-        for ingredient_id in ingredients:
-            ingredient = Ingredients.objects.get(id=ingredient_id['id'])
-            RecipeIngredient.objects.create(
-                ingredient=ingredient,
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
                 recipe=recipe,
-                amount=ingredient_id['amount']
+                ingredient_id=ingredient['id'],
+                amount=ingredient['amount']
             )
-
+            for ingredient in ingredients
+        )
+        recipe.ingredients.add(
+            *(ingredient['id'] for ingredient in ingredients)
+        )
+        # bulk_create не шлёт сигналов.
+        update_search_vectors([recipe.pk])
+        cookable.log_changes(recipe.pk)
+
+    def update_ingredients(self, ingredients, recipe):
+        """Обновляет ингредиенты рецепта, меняя только изменившиеся строки."""
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        current = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in RecipeIngredient.objects.filter(
+                recipe=recipe
+            )
+        }
+        removed = current.keys() - amounts.keys()
+        if removed:
+            with bulk_ingredients():
+                RecipeIngredient.objects.filter(
+                    recipe=recipe, ingredient_id__in=removed
+                ).delete()
+        changed = []
+        for ingredient_id, recipe_ingredient in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and recipe_ingredient.amount != amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        added = [
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        ]
+        if added:
+            RecipeIngredient.objects.bulk_create(added)
+        recipe.ingredients.set(amounts.keys())
+        # bulk-операции не шлют сигналов, а удаление приёмники
+        # пропускают: списки покупок пересчитываются одним вызовом.
+        shopping_list.refresh_recipe(recipe.pk, [
+            *(
+                recipe_ingredient.ingredient_id
+                for recipe_ingredient in changed + added
+            ),
+            *removed
+        ])
+        if added or removed:
+            update_search_vectors([recipe.pk])
+            cookable.log_changes(recipe.pk)
+
+    def close_image(self, validated_data):
+        """Закрывает временный файл загруженного изображения."""
+        image = validated_data.get('image')
+        if image is not None:
+            image.close()
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         author = self.context.get('request').user
@@ -286,21 +411,12 @@ class CreateRecipesSerializer(serializers.ModelSerializer):
             author=author,
             **validated_data
         )
-        if len(tags) < 1:
-            raise serializers.ValidationError({
-                'tags': 'Количество тэгов должно быть больше 0!'
-            })
         recipe.tags.set(tags)
-        if len(ingredients) < 1:
-            raise serializers.ValidationError({
-                'ingredients': 'Количество ингредиента должно быть больше 0!'
-            })
-        for ingredient_id in ingredients:
-            ingredient = Ingredients.objects.get(id=ingredient_id['id'])
-            recipe.ingredients.add(ingredient)
         self.create_ingredients(ingredients, recipe)
+        self.close_image(validated_data)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         instance.image = validated_data.get('image', instance.image)
         instance.name = validated_data.get('name', instance.name)
@@ -309,26 +425,27 @@ class CreateRecipesSerializer(serializers.ModelSerializer):
             'cooking_time',
             instance.cooking_time
         )
-        if len(validated_data.get('tags', instance.tags)) < 1:
-            raise serializers.ValidationError({
-                'tags': 'Количество тэгов должно быть больше 0!'
-            })
-        instance.tags.set(validated_data.get('tags', instance.tags))
-        old_ingredients = RecipeIngredient.objects.filter(recipe=instance)
-        old_ingredients.delete()
-        ingredients = validated_data.pop('ingredients')
-        if len(ingredients) < 1:
-            raise serializers.ValidationError({
-                'ingredients': 'Количество ингредиента должно быть больше 0!'
-            })
-        for ingredient_id in ingredients:
-            ingredient = Ingredients.objects.get(id=ingredient_id['id'])
-            instance.ingredients.add(ingredient)
-        self.create_ingredients(ingredients, instance)
-        instance.save()
+        if 'tags' in validated_data:
+            instance.tags.set(validated_data['tags'])
+        if 'ingredients' in validated_data:
+            self.update_ingredients(validated_data['ingredients'], instance)
+        # Счётчики и версии изображения меняются в обход правки рецепта,
+        # полное сохранение вернуло бы их значения на момент чтения.
+        instance.save(
+            update_fields=['image', 'name', 'text', 'cooking_time']
+        )
+        self.close_image(validated_data)
         return instance
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance],
+            'tags',
+            Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            )
+        )
         return RecipesSerializer(
             instance,
             context={'request': self.context.get('request')}
@@ -338,10 +455,17 @@ class CreateRecipesSerializer(serializers.ModelSerializer):
 class ShowFavoriteSerializer(serializers.ModelSerializer):
     """Сериализатор отображения избранных рецептов."""
 
+    image = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipes
         fields = ('id', 'name', 'image', 'cooking_time')
 
+    def get_image(self, obj):
+        return build_image_url(
+            obj, 'thumbnail', self.context.get('request')
+        )
+
 
 class FavoriteSerializer(serializers.ModelSerializer):
     """ Сериализатор избранных рецептов."""
@@ -378,25 +502,27 @@ class ShowSubscriptionsSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return Subscription.objects.filter(
-            user=request.user, author=obj).exists()
+        if hasattr(obj, 'subscribed'):
+            return obj.subscribed
+        member = get_membership(self.context)
+        return member is not None and obj.id in member.authors
 
     def get_recipes(self, obj):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
-        recipes = Recipes.objects.filter(author=obj)
-        limit = request.query_params.get('recipes_limit')
-        if limit:
-            recipes = recipes[:int(limit)]
+        if hasattr(obj, 'limited_recipes'):
+            recipes = obj.limited_recipes
+        else:
+            recipes = Recipes.objects.filter(author=obj)
+            limit = get_recipes_limit(request)
+            if limit is not None:
+                recipes = recipes[:limit]
         return ShowFavoriteSerializer(
             recipes, many=True, context={'request': request}).data
 
     def get_recipes_count(self, obj):
-        return Recipes.objects.filter(author=obj).count()
+        return obj.recipes_count
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
@@ -431,3 +557,27 @@ class WishListSerializer(serializers.ModelSerializer):
             instance.recipe,
             context={'request': self.context.get('request')}
         ).data
+
+
+class BatchSerializer(serializers.Serializer):
+    """Сериализатор списка id для пакетных запросов."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_TOGGLE_LIMIT
+    )
+
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
+
+
+class CookableSerializer(serializers.Serializer):
+    """Сериализатор параметров запроса «что приготовить»."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.COOKABLE_INGREDIENTS_LIMIT
+    )
+    max_missing = serializers.IntegerField(min_value=0, required=False)
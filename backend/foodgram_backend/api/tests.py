@@ -0,0 +1,708 @@
+import base64
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from io import BytesIO, StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from reportlab.pdfbase import pdfmetrics
+from rest_framework.test import APIClient
+
+from api.pdf import StreamingPDF
+from api.renderers import PDFShoppingCartRenderer
+from api.serializers import CreateRecipesSerializer
+from recipes.models import (
+    Tags,
+    Favorite,
+    Ingredients,
+    Recipes,
+    RecipeIngredient,
+    ShoppingListIngredient,
+    WishList
+)
+from users.models import Subscription
+
+User = get_user_model()
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests-default',
+    },
+    'recipes': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests-recipes',
+    },
+}
+
+
+def create_user(name):
+    return User.objects.create_user(
+        username=name,
+        email=f'{name}@example.org',
+        password='Pass-12345',
+        first_name=name,
+        last_name=name
+    )
+
+
+def create_recipe(
+    author, tags, ingredients, name='Рецепт',
+    image='recipes/images/test.png'
+):
+    recipe = Recipes.objects.create(
+        author=author,
+        name=name,
+        text='Описание',
+        cooking_time=10,
+        image=image
+    )
+    recipe.tags.set(tags)
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=10)
+        for ingredient in ingredients
+    )
+    recipe.ingredients.set(ingredients)
+    return recipe
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class QueryCountTest(TestCase):
+    """Число запросов не зависит от размера страницы и правки."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        cls.tags = Tags.objects.bulk_create(
+            Tags(name=slug, slug=slug, color='#ffffff')
+            for slug in ('breakfast', 'lunch')
+        )
+        cls.ingredients = Ingredients.objects.bulk_create(
+            Ingredients(name=f'Ингредиент {num}', measurement_unit='г')
+            for num in range(20)
+        )
+        for num in range(50):
+            create_recipe(
+                cls.author, cls.tags, cls.ingredients[:3], f'Рецепт {num}'
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def count_queries(self, request, *args, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = request(*args, **kwargs)
+        self.assertLess(response.status_code, 300, response.content)
+        return len(queries)
+
+    def test_recipe_list(self):
+        for fast in (True, False):
+            with self.subTest(fast_serializers=fast), override_settings(
+                FAST_SERIALIZERS=fast
+            ):
+                # Первый запрос заполняет кэши справочников.
+                self.client.get('/api/recipes/?limit=1')
+                expected = self.count_queries(
+                    self.client.get, '/api/recipes/?limit=1'
+                )
+                for limit in (6, 50):
+                    with self.assertNumQueries(expected):
+                        response = self.client.get(
+                            f'/api/recipes/?limit={limit}'
+                        )
+                    self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous_recipe_list(self):
+        client = APIClient()
+        client.get('/api/recipes/?limit=2')
+        expected = self.count_queries(client.get, '/api/recipes/?limit=1')
+        for limit in (6, 50):
+            with self.assertNumQueries(expected):
+                client.get(f'/api/recipes/?limit={limit}')
+
+    def test_recipe_update(self):
+        recipe = create_recipe(self.author, self.tags, self.ingredients)
+        WishList.objects.create(user=self.reader, recipe=recipe)
+        client = APIClient()
+        client.force_authenticate(self.author)
+
+        def update(count):
+            return client.patch(f'/api/recipes/{recipe.pk}/', {
+                'name': 'Рецепт',
+                'text': 'Описание',
+                'cooking_time': 10,
+                'tags': [tag.pk for tag in self.tags],
+                'ingredients': [
+                    {'id': ingredient.pk, 'amount': 10}
+                    for ingredient in self.ingredients[:count]
+                ],
+            }, format='json')
+
+        # Первая правка заполняет кэши справочников.
+        update(20)
+        removed = {
+            count: self.count_queries(update, count)
+            for count in (19, 1)
+        }
+        added = {
+            count: self.count_queries(update, count)
+            for count in (2, 20)
+        }
+        self.assertEqual(removed[19], removed[1])
+        self.assertEqual(added[2], added[20])
+        self.assertEqual(
+            list(recipe.recipeingredient_set.values_list(
+                'ingredient_id', flat=True
+            ).order_by('ingredient_id')),
+            [ingredient.pk for ingredient in self.ingredients]
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalGetTest(TestCase):
+    """ETag ленты зависит от связей самого пользователя, а не чужих."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        cls.other = create_user('other')
+        cls.recipe = create_recipe(cls.author, [], [])
+
+    def get_client(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_recipe_list(self):
+        reader = self.get_client(self.reader)
+        response = reader.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        path = f'/api/recipes/{self.recipe.pk}/favorite/'
+        self.get_client(self.other).post(path)
+        response = reader.get('/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        reader.post(path)
+        response = reader.get('/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['results'][0]['is_favorited'])
+
+
+@override_settings(INGREDIENTS_CATALOGUE_CACHE=False)
+@patch('recipes.search.get_catalogue', side_effect=AssertionError)
+@patch('api.serializers.get_catalogue', side_effect=AssertionError)
+class CatalogueDisabledTest(TestCase):
+    """Без INGREDIENTS_CATALOGUE_CACHE справочник в память не грузится."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tag = Tags.objects.create(
+            name='Обед', slug='lunch', color='#ffffff'
+        )
+        cls.ingredients = Ingredients.objects.bulk_create(
+            Ingredients(name=name, measurement_unit='г')
+            for name in ('Соль', 'Сахар', 'Перец')
+        )
+        cls.recipe = create_recipe(cls.author, [cls.tag], cls.ingredients)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def update(self, ids):
+        return self.client.patch(f'/api/recipes/{self.recipe.pk}/', {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'tags': [self.tag.pk],
+            'ingredients': [{'id': pk, 'amount': 5} for pk in ids],
+        }, format='json')
+
+    def test_recipe_update(self, *mocks):
+        ids = [ingredient.pk for ingredient in self.ingredients]
+        response = self.update(ids[:2])
+        self.assertEqual(response.status_code, 200, response.content)
+        response = self.update([*ids[:2], max(ids) + 1])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ingredient', response.data)
+
+    def test_ingredient_search(self, *mocks):
+        response = self.client.get('/api/ingredients/?name=Са')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [ingredient['name'] for ingredient in response.data],
+            ['Сахар']
+        )
+
+
+class StaleSaveTest(TestCase):
+    """Правка не затирает счётчики, изменённые во время запроса."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        cls.tag = Tags.objects.create(
+            name='Обед', slug='lunch', color='#ffffff'
+        )
+        cls.ingredient = Ingredients.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        cls.recipe = create_recipe(cls.author, [cls.tag], [cls.ingredient])
+
+    def test_recipe_update(self):
+        update_ingredients = CreateRecipesSerializer.update_ingredients
+
+        def favorite_meanwhile(serializer, ingredients, recipe):
+            Favorite.objects.create(user=self.reader, recipe=recipe)
+            update_ingredients(serializer, ingredients, recipe)
+
+        client = APIClient()
+        client.force_authenticate(self.author)
+        with patch.object(
+            CreateRecipesSerializer, 'update_ingredients', favorite_meanwhile
+        ):
+            response = client.patch(f'/api/recipes/{self.recipe.pk}/', {
+                'name': 'Новое название',
+                'text': 'Описание',
+                'cooking_time': 10,
+                'tags': [self.tag.pk],
+                'ingredients': [{'id': self.ingredient.pk, 'amount': 5}],
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Новое название')
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+    def test_change_password(self):
+        set_password = User.set_password
+
+        def subscribe_meanwhile(user, password):
+            Subscription.objects.create(user=self.reader, author=user)
+            set_password(user, password)
+
+        client = APIClient()
+        client.force_authenticate(self.author)
+        with patch.object(User, 'set_password', subscribe_meanwhile):
+            response = client.post('/api/users/set_password/', {
+                'current_password': 'Pass-12345',
+                'new_password': 'Pass-67890',
+            })
+        self.assertEqual(response.status_code, 204, response.content)
+        self.author.refresh_from_db()
+        self.assertTrue(self.author.check_password('Pass-67890'))
+        self.assertEqual(self.author.followers_count, 1)
+        self.assertEqual(self.author.recipes_count, 1)
+
+
+class PDFShoppingCartTest(SimpleTestCase):
+    """PDF отдаётся потоком и не оставляет состояние в общем шрифте."""
+
+    def get_stream(self):
+        renderer = PDFShoppingCartRenderer()
+        renderer.register_font()
+        stream = renderer.stream(
+            {
+                'ingredient__name': f'Ингредиент {num}',
+                'amount': num,
+                'ingredient__measurement_unit': 'г',
+            }
+            for num in range(100)
+        )
+        return stream, pdfmetrics.getFont(renderer.font_name)
+
+    def test_download(self):
+        stream, font = self.get_stream()
+        content = b''.join(stream)
+        self.assertTrue(content.startswith(b'%PDF-1.4'))
+        self.assertTrue(content.endswith(b'%%EOF\n'))
+        self.assertEqual(content.count(b'/Type /Page '), 3)
+        self.assertFalse(font.state)
+
+    def test_aborted_download(self):
+        stream, font = self.get_stream()
+        next(stream)
+        next(stream)
+        self.assertEqual(len(font.state), 1)
+        stream.close()
+        self.assertFalse(font.state)
+
+    def test_close(self):
+        _, font = self.get_stream()
+        pdf = StreamingPDF(font, 12)
+        pdf.page([(0, 0, 'Соль')])
+        self.assertIn(pdf, font.state)
+        pdf.close()
+        self.assertNotIn(pdf, font.state)
+
+
+def create_image(color):
+    buffer = BytesIO()
+    Image.new('RGB', (40, 30), color).save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+class RenditionsTest(TestCase):
+    """Версии изображений пересоздаются и не оставляют старых файлов."""
+
+    @classmethod
+    def setUpClass(cls):
+        # До setUpTestData, чтобы версии таблиц шли в тот же кэш.
+        cls.media = tempfile.mkdtemp()
+        cls.media_settings = override_settings(
+            MEDIA_ROOT=cls.media,
+            IMAGE_RENDITIONS_ASYNC=False,
+            CACHES=LOCMEM_CACHES
+        )
+        cls.media_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tag = Tags.objects.create(
+            name='Обед', slug='lunch', color='#ffffff'
+        )
+        cls.ingredient = Ingredients.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def save_recipe(self, image, recipe=None):
+        data = {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'tags': [self.tag.pk],
+            'ingredients': [{'id': self.ingredient.pk, 'amount': 10}],
+            'image': image,
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            if recipe is None:
+                response = self.client.post(
+                    '/api/recipes/', data, format='json'
+                )
+            else:
+                response = self.client.patch(
+                    f'/api/recipes/{recipe.pk}/', data, format='json'
+                )
+        self.assertLess(response.status_code, 300, response.content)
+        return Recipes.objects.get(pk=response.data['id'])
+
+    def get_files(self, recipe):
+        return [
+            name for key, name in recipe.renditions.items()
+            if key != 'source'
+        ]
+
+    def test_replace_image(self):
+        recipe = self.save_recipe(create_image('red'))
+        previous = self.get_files(recipe)
+        self.assertEqual(len(previous), 3)
+        recipe = self.save_recipe(create_image('blue'), recipe)
+        self.assertEqual(recipe.renditions['source'], recipe.image.name)
+        for name in previous:
+            self.assertFalse(default_storage.exists(name), name)
+        for name in self.get_files(recipe):
+            self.assertTrue(default_storage.exists(name), name)
+
+    def test_command(self):
+        recipe = self.save_recipe(create_image('red'))
+        Recipes.objects.filter(pk=recipe.pk).update(renditions={})
+        output = StringIO()
+        call_command('make_renditions', stdout=output)
+        self.assertIn(
+            'Made renditions of 1 recipes, 0 failed', output.getvalue()
+        )
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.renditions['source'], recipe.image.name)
+        output = StringIO()
+        call_command('make_renditions', stdout=output)
+        self.assertIn('Made renditions of 0 recipes', output.getvalue())
+
+
+class FeedIndexTest(TestCase):
+    """Запросы ленты читают рецепты по индексам, см. explain_recipes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        tag = Tags.objects.create(name='Обед', slug='lunch', color='#ffffff')
+        ingredient = Ingredients.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        create_recipe(author, [tag], [ingredient])
+
+    def test_feed_plans(self):
+        if connection.vendor == 'postgresql':
+            # На нескольких строках полный просмотр дешевле любого
+            # индекса, так проверяется, что индекс вообще применим.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        output = StringIO()
+        call_command('explain_recipes', stdout=output)
+        plans = output.getvalue()
+        self.assertIn('recipes_pub_date_id_idx', plans)
+        self.assertIn('recipes_author_pub_date_idx', plans)
+
+
+class CountersMixin:
+
+    def assertCounters(self, recipe):
+        """Счётчики рецепта и его автора совпадают с числом связей."""
+        recipe = Recipes.objects.select_related('author').get(pk=recipe.pk)
+        self.assertEqual(
+            recipe.favorites_count,
+            Favorite.objects.filter(recipe=recipe).count()
+        )
+        self.assertEqual(
+            recipe.shopping_cart_count,
+            WishList.objects.filter(recipe=recipe).count()
+        )
+        self.assertEqual(
+            recipe.author.followers_count,
+            Subscription.objects.filter(author=recipe.author).count()
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ToggleTest(CountersMixin, TestCase):
+    """Добавление и удаление связей одиночными и пакетными запросами."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        cls.author = create_user('author')
+        cls.ingredient = Ingredients.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        cls.recipes = [
+            create_recipe(cls.author, [], [cls.ingredient]) for _ in range(2)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_single(self):
+        recipe = self.recipes[0]
+        paths = {
+            f'/api/recipes/{recipe.pk}/favorite/': Favorite,
+            f'/api/recipes/{recipe.pk}/shopping_cart/': WishList,
+            f'/api/users/{self.author.pk}/subscribe/': Subscription,
+        }
+        for path, model in paths.items():
+            with self.subTest(path=path):
+                for method, code, exists in (
+                    ('post', 201, True),
+                    ('post', 400, True),
+                    ('delete', 204, False),
+                    ('delete', 400, False),
+                ):
+                    response = getattr(self.client, method)(path)
+                    self.assertEqual(response.status_code, code)
+                    self.assertEqual(
+                        model.objects.filter(user=self.user).exists(), exists
+                    )
+                    self.assertCounters(recipe)
+
+    def test_shopping_list(self):
+        path = f'/api/recipes/{self.recipes[0].pk}/shopping_cart/'
+        self.client.post(path)
+        self.assertEqual(
+            list(ShoppingListIngredient.objects.filter(
+                user=self.user
+            ).values_list('ingredient_id', 'amount')),
+            [(self.ingredient.pk, 10)]
+        )
+        self.client.delete(path)
+        self.assertFalse(
+            ShoppingListIngredient.objects.filter(user=self.user).exists()
+        )
+
+    def test_batch(self):
+        ids = [recipe.pk for recipe in self.recipes]
+        missing = max(ids) + 1
+        for method, codes in (
+            ('post', [201, 201, 400]),
+            ('post', [400, 400, 400]),
+            ('delete', [204, 204, 404]),
+            ('delete', [400, 400, 404]),
+        ):
+            response = getattr(self.client, method)(
+                '/api/recipes/favorite/',
+                {'ids': [*ids, missing]},
+                format='json'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['results'], [
+                {'id': pk, 'status': code}
+                for pk, code in zip([*ids, missing], codes)
+            ])
+            for recipe in self.recipes:
+                self.assertCounters(recipe)
+
+
+def request_together(method, requests):
+    """Запросы [(пользователь, адрес)] из отдельных потоков одновременно."""
+    statuses = []
+    barrier = threading.Barrier(len(requests))
+
+    def client(user, path):
+        api = APIClient()
+        api.force_authenticate(user)
+        barrier.wait()
+        try:
+            statuses.append(getattr(api, method)(path).status_code)
+        finally:
+            connections.close_all()
+
+    threads = [
+        threading.Thread(target=client, args=request) for request in requests
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return Counter(statuses)
+
+
+@skipUnless(
+    connection.vendor == 'postgresql',
+    'Одновременные запросы проверяются только на PostgreSQL.'
+)
+@override_settings(CACHES=LOCMEM_CACHES)
+class ToggleRaceTest(CountersMixin, TransactionTestCase):
+    """
+    Одновременные добавления и удаления: для одной пары
+    пользователь/рецепт состояние меняет ровно один запрос, а счётчики
+    остаются точными и при запросах разных пользователей.
+    """
+    clients = 16
+    rounds = 3
+
+    def setUp(self):
+        self.user = create_user('reader')
+        self.author = create_user('author')
+        # Без изображения, чтобы после коммита не запускалось пережатие.
+        self.recipe = create_recipe(self.author, [], [], image='')
+
+    def test_toggles(self):
+        paths = (
+            f'/api/recipes/{self.recipe.pk}/favorite/',
+            f'/api/recipes/{self.recipe.pk}/shopping_cart/',
+            f'/api/users/{self.author.pk}/subscribe/',
+        )
+        expected = {
+            'post': {201: 1, 400: self.clients - 1},
+            'delete': {204: 1, 400: self.clients - 1},
+        }
+        for _ in range(self.rounds):
+            for method in ('post', 'delete'):
+                for path in paths:
+                    with self.subTest(method=method, path=path):
+                        self.assertEqual(request_together(
+                            method, [(self.user, path)] * self.clients
+                        ), expected[method])
+                        self.assertCounters(self.recipe)
+
+    def test_counters(self):
+        readers = [
+            create_user(f'reader{num}') for num in range(self.clients)
+        ]
+        paths = (
+            f'/api/recipes/{self.recipe.pk}/favorite/',
+            f'/api/recipes/{self.recipe.pk}/shopping_cart/',
+            f'/api/users/{self.author.pk}/subscribe/',
+        )
+        for _ in range(self.rounds):
+            for method, code in (('post', 201), ('delete', 204)):
+                for path in paths:
+                    with self.subTest(method=method, path=path):
+                        self.assertEqual(request_together(
+                            method, [(reader, path) for reader in readers]
+                        ), {code: self.clients})
+                        self.assertCounters(self.recipe)
+
+
+@skipUnless(
+    connection.vendor == 'postgresql',
+    'Одновременные запросы проверяются только на PostgreSQL.'
+)
+@override_settings(CACHES=LOCMEM_CACHES)
+class ShoppingListRaceTest(TransactionTestCase):
+    """
+    Разные рецепты с общим ингредиентом, одновременно добавленные
+    в корзину: строка списка покупок создаётся один раз и суммируется.
+    """
+    clients = 8
+    rounds = 3
+
+    def setUp(self):
+        self.user = create_user('reader')
+        author = create_user('author')
+        self.ingredient = Ingredients.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        self.recipes = [
+            create_recipe(author, [], [self.ingredient], image='')
+            for _ in range(self.clients)
+        ]
+
+    def test_add_recipes(self):
+        paths = [
+            f'/api/recipes/{recipe.pk}/shopping_cart/'
+            for recipe in self.recipes
+        ]
+        for _ in range(self.rounds):
+            self.assertEqual(
+                request_together(
+                    'post', [(self.user, path) for path in paths]
+                ),
+                {201: self.clients}
+            )
+            self.assertEqual(
+                list(ShoppingListIngredient.objects.filter(
+                    user=self.user
+                ).values_list('ingredient_id', 'amount')),
+                [(self.ingredient.pk, 10 * self.clients)]
+            )
+            self.assertEqual(
+                request_together(
+                    'delete', [(self.user, path) for path in paths]
+                ),
+                {204: self.clients}
+            )
+            self.assertFalse(
+                ShoppingListIngredient.objects.filter(user=self.user).exists()
+            )
@@ -0,0 +1,133 @@
+from django.db import connections, router, transaction
+from django.db.models.signals import post_delete, post_save
+
+
+def get_columns(model, field):
+    """Таблица связи, её столбцы user и field, таблица цели связи."""
+    meta = model._meta
+    target = meta.get_field(field).related_model._meta
+    return (
+        meta.db_table,
+        meta.pk.column,
+        meta.get_field('user').column,
+        meta.get_field(field).column,
+        target.db_table,
+        target.pk.column,
+    )
+
+
+def get_instances(model, field, user_id, rows, using):
+    """Экземпляры связей по строкам (pk, id цели) из RETURNING."""
+    instances = []
+    for pk, target_id in rows:
+        instance = model(
+            pk=pk, user_id=user_id, **{f'{field}_id': target_id}
+        )
+        instance._state.adding = False
+        instance._state.db = using
+        instances.append(instance)
+    return instances
+
+
+def add_links(model, field, user_id, target_ids):
+    """
+    Создаёт связи пользователя с объектами одним INSERT ... ON CONFLICT.
+
+    Возвращает только новые связи: уже существующие и связи
+    с отсутствующими объектами пропускаются. Запрос сигналов не шлёт,
+    поэтому post_save отправляется вручную, и счётчики, версии и списки
+    покупок обновляются как при save().
+    """
+    if not target_ids:
+        return []
+    using = router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    table, pk, user, column, target, target_pk = get_columns(model, field)
+    placeholders = ', '.join(['%s'] * len(target_ids))
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {qn(table)} ({qn(user)}, {qn(column)}) '
+            f'SELECT %s, {qn(target_pk)} FROM {qn(target)} '
+            f'WHERE {qn(target_pk)} IN ({placeholders}) '
+            f'ON CONFLICT DO NOTHING RETURNING {qn(pk)}, {qn(column)}',
+            [user_id, *target_ids]
+        )
+        instances = get_instances(
+            model, field, user_id, cursor.fetchall(), using
+        )
+        for instance in instances:
+            post_save.send(
+                sender=model,
+                instance=instance,
+                created=True,
+                update_fields=None,
+                raw=False,
+                using=using
+            )
+    return instances
+
+
+def remove_links(model, field, user_id, target_ids):
+    """
+    Удаляет связи одним DELETE ... RETURNING.
+
+    Возвращает удалённые связи, post_delete отправляется вручную.
+    """
+    if not target_ids:
+        return []
+    using = router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    table, pk, user, column, _, _ = get_columns(model, field)
+    placeholders = ', '.join(['%s'] * len(target_ids))
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {qn(table)} '
+            f'WHERE {qn(user)} = %s AND {qn(column)} IN ({placeholders}) '
+            f'RETURNING {qn(pk)}, {qn(column)}',
+            [user_id, *target_ids]
+        )
+        instances = get_instances(
+            model, field, user_id, cursor.fetchall(), using
+        )
+        for instance in instances:
+            post_delete.send(
+                sender=model,
+                instance=instance,
+                using=using,
+                origin=instance
+            )
+    return instances
+
+
+def add_link(model, field, user_id, target_id):
+    """Новая связь или None, если она уже была или объекта нет."""
+    instances = add_links(model, field, user_id, [target_id])
+    return instances[0] if instances else None
+
+
+def remove_link(model, field, user_id, target_id):
+    """True, если связь была и удалена."""
+    return bool(remove_links(model, field, user_id, [target_id]))
+
+
+def toggle_links(model, field, user_id, target_ids, add=True):
+    """
+    Добавляет или удаляет связи с объектами в одной транзакции.
+
+    Возвращает id объектов, связь с которыми изменилась, и id всех
+    найденных объектов, чтобы отличить уже связанные от отсутствующих.
+    """
+    target = model._meta.get_field(field).related_model
+    using = router.db_for_write(model)
+    with transaction.atomic(using=using):
+        found = set(target.objects.using(using).filter(
+            pk__in=target_ids
+        ).values_list('pk', flat=True))
+        toggle = add_links if add else remove_links
+        changed = {
+            getattr(instance, f'{field}_id')
+            for instance in toggle(model, field, user_id, sorted(found))
+        }
+    return changed, found
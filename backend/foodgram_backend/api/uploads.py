@@ -0,0 +1,87 @@
+import binascii
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import (
+    InMemoryUploadedFile,
+    TemporaryUploadedFile
+)
+from rest_framework import serializers
+
+BASE64_MARKER = ';base64,'
+# Размер куска в символах base64, кратен 4.
+CHUNK_SIZE = 64 * 1024
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+)
+INVALID_MESSAGE = 'Некорректное изображение в формате base64.'
+
+
+def detect_format(head):
+    """Формат изображения по первым байтам или None."""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    for signature, image_format in SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    return None
+
+
+def get_decoded_size(data, start):
+    padding = data.endswith('=') + data.endswith('==')
+    return (len(data) - start) * 3 // 4 - padding
+
+
+def decode_base64_image(data):
+    """
+    Декодирует data:image/...;base64,... во временный файл.
+
+    Размер проверяется до декодирования, формат — по сигнатуре первых
+    байт. Дальше строка декодируется кусками: небольшие изображения
+    собираются в памяти, крупнее FILE_UPLOAD_MAX_MEMORY_SIZE — во
+    временном файле на диске, как обычные загрузки Django.
+    """
+    marker = data.find(BASE64_MARKER)
+    if marker == -1:
+        raise serializers.ValidationError(INVALID_MESSAGE)
+    start = marker + len(BASE64_MARKER)
+    size = get_decoded_size(data, start)
+    max_size = settings.RECIPE_IMAGE_MAX_SIZE
+    if size > max_size:
+        raise serializers.ValidationError(
+            f'Размер изображения не должен превышать '
+            f'{max_size // (1024 * 1024)} МБ.'
+        )
+    try:
+        head = binascii.a2b_base64(data[start:start + 64])
+    except binascii.Error:
+        raise serializers.ValidationError(INVALID_MESSAGE)
+    image_format = detect_format(head)
+    if image_format is None:
+        raise serializers.ValidationError('Файл не является изображением.')
+    name = 'temp.' + ('jpg' if image_format == 'jpeg' else image_format)
+    content_type = f'image/{image_format}'
+    if size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+        file = TemporaryUploadedFile(name, content_type, size, None)
+    else:
+        file = InMemoryUploadedFile(
+            BytesIO(), None, name, content_type, size, None
+        )
+    written = 0
+    try:
+        for pos in range(start, len(data), CHUNK_SIZE):
+            chunk = binascii.a2b_base64(data[pos:pos + CHUNK_SIZE])
+            written += len(chunk)
+            if written > max_size:
+                raise serializers.ValidationError(INVALID_MESSAGE)
+            file.write(chunk)
+    except (binascii.Error, serializers.ValidationError):
+        file.close()
+        raise serializers.ValidationError(INVALID_MESSAGE)
+    file.seek(0)
+    file.size = written
+    return file
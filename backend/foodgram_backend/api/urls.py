@@ -14,6 +14,10 @@ from .views import (
     SubscribeView,
     ShowSubscriptionsView,
     WishListView,
+    FavoriteBatchView,
+    SubscribeBatchView,
+    WishListBatchView,
+    CookableView,
     download_shopping_cart
 )
 
@@ -29,11 +33,15 @@ urlpatterns = [
     path('auth/token/logout/', del_token),
     path('users/set_password/', change_password),
     path('users/subscriptions/', ShowSubscriptionsView.as_view()),
+    path('users/subscribe/', SubscribeBatchView.as_view()),
     path('users/<int:id>/subscribe/', SubscribeView.as_view()),
     path(
         'recipes/<int:id>/favorite/', FavoriteView.as_view(), name='favorite'
     ),
     path('recipes/<int:id>/shopping_cart/', WishListView.as_view()),
+    path('recipes/favorite/', FavoriteBatchView.as_view()),
+    path('recipes/shopping_cart/', WishListBatchView.as_view()),
     path('recipes/download_shopping_cart/', download_shopping_cart),
+    path('recipes/cookable/', CookableView.as_view()),
     path('', include(router.urls))
 ]
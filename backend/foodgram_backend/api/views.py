@@ -1,27 +1,52 @@
+from adrf.decorators import api_view as async_api_view
+from adrf.views import APIView as AsyncAPIView
+from asgiref.sync import sync_to_async
 from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
 from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.auth import get_user_model
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import (
+    api_view,
+    permission_classes,
+    renderer_classes
+)
 from rest_framework.generics import ListAPIView
 from rest_framework.response import Response
 from rest_framework import viewsets, filters, status
-from django.db.models import Sum
-from django.http import HttpResponse
-
+from django.db.models import Prefetch, Value
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+
+from .cache import get_page, get_snapshot, set_page
+from .conditional import conditional
+from .fast_serializers import RECIPE_FIELDS, serialize_recipes, serialize_tags
 from .filters import IngredientFilter, RecipeFilter
 from .permissions import IsAuthorOrAdminOrReadOnly
-from .pagination import CustomPagination
+from .pagination import (
+    CookablePagination,
+    CustomPagination,
+    IngredientSearchPagination
+)
+from .toggles import add_link, remove_link, toggle_links
+from .renderers import (
+    TXTShoppingCartRenderer,
+    CSVShoppingCartRenderer,
+    PDFShoppingCartRenderer
+)
 from recipes.models import (
     Tags,
     Ingredients,
     Recipes,
     RecipeIngredient,
     Favorite,
-    WishList
+    WishList,
+    ShoppingListIngredient
 )
+from recipes import cookable, membership
+from recipes.catalogue import get_catalogue
 from users.models import Subscription
 from .serializers import (
     UserSerializer,
@@ -34,10 +59,16 @@ from .serializers import (
     FavoriteSerializer,
     SubscriptionSerializer,
     ShowSubscriptionsSerializer,
-    WishListSerializer
+    WishListSerializer,
+    BatchSerializer,
+    CookableSerializer,
+    get_recipes_limit
 )
 
 User = get_user_model()
+aadd_link = sync_to_async(add_link)
+aremove_link = sync_to_async(remove_link)
+atoggle_links = sync_to_async(toggle_links)
 
 
 class GetTokenAPIView(APIView):
@@ -104,11 +135,11 @@ class UserViewSet(viewsets.ModelViewSet):
         )
 
 
-@api_view(['GET'])
+@async_api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def user_me(request):
+async def user_me(request):
     """Страница пользователя, отправляющего запрос."""
-    me = get_object_or_404(User, username=request.user)
+    me = await aget_object_or_404(User, username=request.user)
     serializer = UserSerializer(me, many=False)
     return Response(serializer.data)
 
@@ -124,10 +155,12 @@ def change_password(request):
     )
     if serializer.is_valid(raise_exception=True):
         user.set_password(serializer.validated_data.get('new_password'))
-        user.save()
+        user.save(update_fields=['password'])
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+@method_decorator(conditional(Tags), name='list')
+@method_decorator(conditional(Tags), name='retrieve')
 class TagsViewSet(viewsets.ModelViewSet):
     """Вьюсет тэгов."""
     queryset = Tags.objects.all()
@@ -135,26 +168,111 @@ class TagsViewSet(viewsets.ModelViewSet):
     serializer_class = TagsSerializer
     permission_classes = (AllowAny,)
 
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_SERIALIZERS:
+            return super().list(request, *args, **kwargs)
+        return Response(serialize_tags(self.filter_queryset(
+            self.get_queryset()
+        )))
 
+
+@method_decorator(conditional(Ingredients), name='list')
+@method_decorator(conditional(Ingredients), name='retrieve')
 class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
     """Вьюсет ингредиентов."""
     permission_classes = (AllowAny,)
-    pagination_class = None
+    pagination_class = IngredientSearchPagination
     serializer_class = IngredientsSerializer
     queryset = Ingredients.objects.all()
     filter_backends = [IngredientFilter, ]
-    search_fields = ['^name', ]
-
 
+    def list(self, request, *args, **kwargs):
+        if not settings.INGREDIENTS_CATALOGUE_CACHE:
+            return super().list(request, *args, **kwargs)
+        catalogue = get_catalogue()
+        name = request.query_params.get(
+            IngredientFilter.search_param, ''
+        ).strip()
+        if name:
+            return Response(catalogue.search(
+                name, settings.INGREDIENTS_SEARCH_LIMIT
+            ))
+        return Response(catalogue.all())
+
+    def retrieve(self, request, *args, **kwargs):
+        if not settings.INGREDIENTS_CATALOGUE_CACHE:
+            return super().retrieve(request, *args, **kwargs)
+        try:
+            ingredient = get_catalogue().get(int(kwargs['pk']))
+        except ValueError:
+            ingredient = None
+        if ingredient is None:
+            raise Http404
+        return Response(ingredient)
+
+
+RECIPE_TABLES = (Recipes, Tags, RecipeIngredient, Ingredients, User)
+# Избранное, корзина и подписки пользователя, см. recipes.membership.
+RECIPE_USER_KEYS = (membership.get_version_key,)
+
+
+@method_decorator(
+    conditional(*RECIPE_TABLES, user_keys=RECIPE_USER_KEYS), name='list'
+)
+@method_decorator(
+    conditional(*RECIPE_TABLES, user_keys=RECIPE_USER_KEYS),
+    name='retrieve'
+)
 class RecipesViewSet(viewsets.ModelViewSet):
     """Вьюсет рецептов."""
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
     pagination_class = CustomPagination
+    cursor_ordering = ('-pub_date', '-id')
     queryset = Recipes.objects.select_related('author').all()
     serializer_class = RecipesSerializer
     filter_backends = [DjangoFilterBackend, ]
     filterset_class = RecipeFilter
 
+    def list(self, request, *args, **kwargs):
+        """Страницы ленты для анонимных пользователей берутся из кэша."""
+        if request.user.is_authenticated:
+            return self.list_page(request, *args, **kwargs)
+        data = get_page(request)
+        if data is not None:
+            return Response(data)
+        snapshot = get_snapshot(request)
+        response = self.list_page(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            set_page(request, response.data, snapshot)
+        return response
+
+    def list_page(self, request, *args, **kwargs):
+        """Страница ленты, при FAST_SERIALIZERS — из строк .values()."""
+        if not settings.FAST_SERIALIZERS:
+            return super().list(request, *args, **kwargs)
+        page = self.paginate_queryset(self.filter_queryset(
+            Recipes.objects.values(*RECIPE_FIELDS)
+        ))
+        return self.get_paginated_response(
+            serialize_recipes(page, request, 'card')
+        )
+
+    def get_queryset(self):
+        """
+        Для чтения подгружает тэги, ингредиенты и авторов пачкой, чтобы
+        число запросов не зависело от размера страницы. Флаги текущего
+        пользователя берутся из его множеств, см. recipes.membership.
+        """
+        if self.action not in ('list', 'retrieve'):
+            return super().get_queryset()
+        return Recipes.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            )
+        )
+
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return RecipesSerializer
@@ -163,84 +281,96 @@ class RecipesViewSet(viewsets.ModelViewSet):
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context.update({'request': self.request})
+        if self.action == 'list':
+            context['image_rendition'] = 'card'
         return context
 
 
-class FavoriteView(APIView):
+async def aget_object_or_404(model, **kwargs):
+    try:
+        return await model.objects.aget(**kwargs)
+    except model.DoesNotExist:
+        raise Http404
+
+
+async def removed_or_400(model, field, request, id):
+    """
+    204, если связь удалена, 400, если её не было, и 404 без объекта.
+
+    Удаление одним DELETE ... RETURNING, так что из двух одновременных
+    запросов 204 получает ровно один.
+    """
+    if await aremove_link(model, field, request.user.id, id):
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    target = model._meta.get_field(field).related_model
+    await aget_object_or_404(target, id=id)
+    return Response(status=status.HTTP_400_BAD_REQUEST)
+
+
+class FavoriteView(AsyncAPIView):
     """Добавление рецепта в избранное, удаление рецепта из избранного."""
     permission_classes = (IsAuthenticated,)
     pagination_class = CustomPagination
 
-    def post(self, request, id):
-        data = {
-            'user': request.user.id,
-            'recipe': id
-        }
-        if not Favorite.objects.filter(
-                user=request.user,
-                recipe__id=id
-        ).exists():
-            serializer = FavoriteSerializer(
-                data=data, context={'request': request}
-            )
-            if serializer.is_valid():
-                serializer.save()
-                return Response(
-                    serializer.data,
-                    status=status.HTTP_201_CREATED
-                )
-        return Response(status=status.HTTP_400_BAD_REQUEST)
-
-    def delete(self, request, id):
-        recipe = get_object_or_404(Recipes, id=id)
-        if Favorite.objects.filter(
-                user=request.user,
-                recipe=recipe
-        ).exists():
-            Favorite.objects.filter(user=request.user, recipe=recipe).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
-
-
-class SubscribeView(APIView):
+    async def post(self, request, id):
+        recipe = await Recipes.objects.filter(id=id).afirst()
+        if recipe is None:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        favorite = await aadd_link(Favorite, 'recipe', request.user.id, id)
+        if favorite is None:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        favorite.recipe = recipe
+        serializer = FavoriteSerializer(
+            favorite, context={'request': request}
+        )
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    async def delete(self, request, id):
+        return await removed_or_400(Favorite, 'recipe', request, id)
+
+
+class SubscribeView(AsyncAPIView):
     """Подписка на авторов, отписка от авторов."""
     permission_classes = (IsAuthenticated,)
 
-    def post(self, request, id):
-        data = {
-            'user': request.user.id,
-            'author': id
-        }
+    async def post(self, request, id):
+        author = await User.objects.filter(id=id).afirst()
+        if author is None:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        subscription = await aadd_link(
+            Subscription, 'author', request.user.id, id
+        )
+        if subscription is None:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        subscription.author = author
         serializer = SubscriptionSerializer(
-            data=data,
-            context={'request': request}
+            subscription, context={'request': request}
         )
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
-
-    def delete(self, request, id):
-        author = get_object_or_404(User, id=id)
-        if Subscription.objects.filter(
-                user=request.user, author=author
-        ).exists():
-            subscription = get_object_or_404(
-                Subscription, user=request.user, author=author
-            )
-            subscription.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+        # Список рецептов автора читается из базы синхронно.
+        data = await sync_to_async(lambda: serializer.data)()
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    async def delete(self, request, id):
+        return await removed_or_400(Subscription, 'author', request, id)
 
 
 class ShowSubscriptionsView(ListAPIView):
     """Отображение подписок пользователя."""
     permission_classes = (IsAuthenticated,)
     pagination_class = CustomPagination
+    cursor_ordering = ('-id',)
 
     def get(self, request):
         user = request.user
-        queryset = User.objects.filter(author__user=user)
+        recipes = Recipes.objects.order_by('-pub_date', '-id')
+        limit = get_recipes_limit(request)
+        if limit is not None:
+            recipes = recipes[:limit]
+        queryset = User.objects.filter(author__user=user).annotate(
+            subscribed=Value(True)
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        )
         page = self.paginate_queryset(queryset)
         serializer = ShowSubscriptionsSerializer(
             page, many=True, context={'request': request}
@@ -248,55 +378,141 @@ class ShowSubscriptionsView(ListAPIView):
         return self.get_paginated_response(serializer.data)
 
 
-class WishListView(APIView):
+class WishListView(AsyncAPIView):
     """Добавление рецепта в список покупок, удаление из списка."""
     permission_classes = (IsAuthenticated,)
 
-    def post(self, request, id):
-        data = {
-            'user': request.user.id,
-            'recipe': id
-        }
-        recipe = get_object_or_404(Recipes, id=id)
-        if not WishList.objects.filter(
-                user=request.user, recipe=recipe
-        ).exists():
-            serializer = WishListSerializer(
-                data=data, context={'request': request}
+    async def post(self, request, id):
+        recipe = await aget_object_or_404(Recipes, id=id)
+        wish = await aadd_link(WishList, 'recipe', request.user.id, id)
+        if wish is None:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        wish.recipe = recipe
+        serializer = WishListSerializer(wish, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    async def delete(self, request, id):
+        return await removed_or_400(WishList, 'recipe', request, id)
+
+
+class BatchToggleView(AsyncAPIView):
+    """
+    Пакетное добавление и удаление связей по списку id в теле запроса.
+
+    Все связи меняются в одной транзакции, а для каждого id
+    возвращается код, который вернул бы одиночный запрос.
+    """
+    permission_classes = (IsAuthenticated,)
+    model = None
+    field = None
+    missing_status = status.HTTP_400_BAD_REQUEST
+
+    async def toggle(self, request, add):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        changed, found = await atoggle_links(
+            self.model, self.field, request.user.id, ids, add
+        )
+        if add:
+            done, missing = status.HTTP_201_CREATED, self.missing_status
+        else:
+            done = status.HTTP_204_NO_CONTENT
+            missing = status.HTTP_404_NOT_FOUND
+        results = []
+        for pk in ids:
+            if pk in changed:
+                code = done
+            elif pk in found:
+                code = status.HTTP_400_BAD_REQUEST
+            else:
+                code = missing
+            results.append({'id': pk, 'status': code})
+        return Response({'results': results})
+
+    async def post(self, request):
+        return await self.toggle(request, add=True)
+
+    async def delete(self, request):
+        return await self.toggle(request, add=False)
+
+
+class FavoriteBatchView(BatchToggleView):
+    """Пакетное добавление рецептов в избранное и удаление из него."""
+    model = Favorite
+    field = 'recipe'
+
+
+class SubscribeBatchView(BatchToggleView):
+    """Пакетная подписка на авторов и отписка от них."""
+    model = Subscription
+    field = 'author'
+
+
+class WishListBatchView(BatchToggleView):
+    """Пакетное добавление рецептов в список покупок и удаление из него."""
+    model = WishList
+    field = 'recipe'
+    missing_status = status.HTTP_404_NOT_FOUND
+
+
+class CookableView(ListAPIView):
+    """
+    Что приготовить: рецепты по покрытию набора ингредиентов.
+
+    Сначала рецепты, для которых хватает всех ингредиентов, затем
+    с наименьшим числом недостающих (поле missing). Подсчёт идёт
+    по индексу в памяти процесса, см. recipes.cookable.
+    """
+    permission_classes = (AllowAny,)
+    pagination_class = CookablePagination
+
+    def get(self, request):
+        serializer = CookableSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        page = self.paginate_queryset(cookable.rank(
+            serializer.validated_data['ingredients'],
+            serializer.validated_data.get('max_missing')
+        ))
+        missing = dict(page)
+        rows = {
+            row['id']: row
+            for row in Recipes.objects.values(*RECIPE_FIELDS).filter(
+                id__in=missing
             )
-            if serializer.is_valid():
-                serializer.save()
-                return Response(
-                    serializer.data, status=status.HTTP_201_CREATED)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
-
-    def delete(self, request, id):
-        recipe = get_object_or_404(Recipes, id=id)
-        if WishList.objects.filter(
-                user=request.user, recipe=recipe
-        ).exists():
-            WishList.objects.filter(user=request.user, recipe=recipe).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+        }
+        recipes = serialize_recipes(
+            [rows[pk] for pk in missing if pk in rows], request, 'card'
+        )
+        for recipe in recipes:
+            recipe['missing'] = missing[recipe['id']]
+        return self.get_paginated_response(recipes)
 
 
 @api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([
+    TXTShoppingCartRenderer,
+    CSVShoppingCartRenderer,
+    PDFShoppingCartRenderer
+])
 def download_shopping_cart(request):
-    """Скачать список покупок."""
-    download_list = "Cписок покупок:"
-    ingredients = RecipeIngredient.objects.filter(
-        recipe__shopping_cart__user=request.user
+    """Скачать список покупок в формате txt, csv или pdf."""
+    renderer = request.accepted_renderer
+    ingredients = ShoppingListIngredient.objects.filter(
+        user=request.user
     ).values(
-        'ingredient__name', 'ingredient__measurement_unit'
-    ).annotate(amount=Sum('amount'))
-    for num, i in enumerate(ingredients):
-        download_list += (
-            f"\n{i['ingredient__name']} - "
-            f"{i['amount']} {i['ingredient__measurement_unit']}"
-        )
-        if num < ingredients.count() - 1:
-            download_list += ', '
+        'ingredient__name', 'ingredient__measurement_unit', 'amount'
+    ).order_by('ingredient__name')
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type = f'{content_type}; charset={renderer.charset}'
+    response = StreamingHttpResponse(
+        renderer.stream(ingredients.iterator()),
+        content_type=content_type
+    )
     file_name = 'shopping_cart'
-    response = HttpResponse(download_list, 'Content-Type: application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{file_name}.pdf"'
+    response['Content-Disposition'] = (
+        f'attachment; filename="{file_name}.{renderer.extension}"'
+    )
     return response
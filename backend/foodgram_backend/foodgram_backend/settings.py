@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 import os
+import tempfile
 from datetime import timedelta
 from dotenv import load_dotenv
 
@@ -56,6 +57,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -63,6 +65,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.InstrumentationMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram_backend.urls'
@@ -88,17 +91,62 @@ WSGI_APPLICATION = 'foodgram_backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
+# DB_ENGINE=sqlite — локальная база в файле, например для нагрузочных
+# тестов на сгенерированных данных.
+if os.getenv('DB_ENGINE') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'django'),
+            'USER': os.getenv('POSTGRES_USER', 'django'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', ''),
+            'PORT': os.getenv('DB_PORT', 5432)
+        }
+    }
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Бэкенд можно заменить через переменные окружения, например на
+# memcached или redis, общие для всех контейнеров.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.getenv('POSTGRES_DB', 'django'),
-        'USER': os.getenv('POSTGRES_USER', 'django'),
-        'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
-        'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram_cache')
+        ),
+    },
+    'recipes': {
+        'BACKEND': os.getenv(
+            'RECIPES_CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'RECIPES_CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram_recipes_cache')
+        ),
     }
 }
 
+RECIPES_PAGE_CACHE = 'recipes'
+RECIPES_PAGE_CACHE_TIMEOUT = 300
+# Подписки, избранное и корзина пользователя для флагов is_subscribed,
+# is_favorited и is_in_shopping_cart; без кэша читаются раз за запрос.
+MEMBERSHIP_CACHE = os.getenv('MEMBERSHIP_CACHE', 'True') == 'True'
+MEMBERSHIP_CACHE_TIMEOUT = 300
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -134,6 +182,44 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', 20 * 1024 * 1024)
+)
+IMAGE_RENDITIONS_ASYNC = True
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+SHOPPING_CART_FONT = os.path.join(
+    BASE_DIR, 'data', 'fonts', 'DejaVuSans.ttf'
+)
+
+# Замеры запросов: Server-Timing и строка в лог на каждый запрос.
+REQUEST_INSTRUMENTATION = (
+    os.getenv('REQUEST_INSTRUMENTATION', 'False') == 'True'
+)
+# Сколько одинаковых запросов за запрос считать признаком N+1.
+N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', 5))
+
+# Метрики Prometheus на /metrics. Под gunicorn с несколькими воркерами
+# нужен PROMETHEUS_MULTIPROC_DIR, см. gunicorn.conf.py.
+PROMETHEUS_METRICS = os.getenv('PROMETHEUS_METRICS', 'False') == 'True'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.middleware': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -153,6 +239,28 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
 }
 
+# Лента рецептов и тэги собираются из .values() без полей DRF.
+FAST_SERIALIZERS = os.getenv('FAST_SERIALIZERS', 'True') == 'True'
+
+INGREDIENTS_SEARCH_LIMIT = 30
+# Конфигурация полнотекстового поиска рецептов на PostgreSQL.
+RECIPE_SEARCH_CONFIG = os.getenv('RECIPE_SEARCH_CONFIG', 'russian')
+# Сколько лучших совпадений отдаёт поиск рецептов вне PostgreSQL: их id
+# попадают в запрос параметрами, а SQLite ограничивает их число.
+RECIPE_SEARCH_FALLBACK_LIMIT = 200
+# Журнал изменений для индекса «что приготовить»: сколько последних
+# записей хранится и сколько перечитывается на случай поздних коммитов.
+COOKABLE_LOG_SIZE = 10000
+COOKABLE_LOG_OVERLAP = 100
+# Сколько ингредиентов можно передать в запросе «что приготовить».
+COOKABLE_INGREDIENTS_LIMIT = 200
+# Сколько id можно передать в одном пакетном запросе избранного,
+# корзины или подписок.
+BATCH_TOGGLE_LIMIT = 100
+INGREDIENTS_CATALOGUE_CACHE = (
+    os.getenv('INGREDIENTS_CATALOGUE_CACHE', 'True') == 'True'
+)
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
 }
@@ -0,0 +1,32 @@
+import os
+import shutil
+
+# ASGI=True запускает приложение через asgi.py в воркерах uvicorn:
+# медленные клиенты не занимают воркер, пока передают запрос или читают
+# ответ, а асинхронные вьюхи (избранное, корзина, подписки, users/me)
+# обслуживаются одним воркером параллельно. Запросы к базе и
+# синхронные вьюхи при этом идут по одному в потоке воркера, так что
+# число воркеров (WEB_CONCURRENCY) стоит оставить как в режиме WSGI.
+ASGI = os.environ.get('ASGI', 'False') == 'True'
+
+bind = '0.0.0.0:8000'
+if ASGI:
+    wsgi_app = 'foodgram_backend.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'foodgram_backend.wsgi:application'
+
+
+def on_starting(server):
+    """Очищает метрики воркеров прошлого запуска."""
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
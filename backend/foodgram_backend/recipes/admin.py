@@ -6,28 +6,55 @@ from .models import (
     Recipes,
     RecipeIngredient,
     Favorite,
-    WishList
+    WishList,
+    ShoppingListIngredient
 )
+from . import cookable
+from .search import update_search_vectors
 
 
 class RecipesAdmin(admin.ModelAdmin):
     list_display = ('name', 'author', 'favorites_count')
     list_filter = ('author', 'name', 'tags')
 
-    def favorites_count(self, obj):
-        if Favorite.objects.filter(recipe=obj).exists():
-            return Favorite.objects.filter(recipe=obj).count()
-        return 0
-
 
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'measurement_unit')
     list_filter = ('name', )
 
 
+class RecipeIngredientAdmin(admin.ModelAdmin):
+    """
+    Строки состава рецептов. Сигналы строк зависимое от состава
+    не пересчитывают, поэтому это делается здесь.
+    """
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        recipe_ids = {obj.recipe_id}
+        if change and 'recipe' in form.changed_data:
+            recipe_ids.add(form.initial['recipe'])
+        self.recipes_changed(recipe_ids)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.recipes_changed({obj.recipe_id})
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        self.recipes_changed(recipe_ids)
+
+    def recipes_changed(self, recipe_ids):
+        if recipe_ids:
+            update_search_vectors(list(recipe_ids))
+            cookable.log_changes(*recipe_ids)
+
+
 admin.site.register(Tags)
 admin.site.register(Ingredients, IngredientAdmin)
 admin.site.register(Recipes, RecipesAdmin)
-admin.site.register(RecipeIngredient)
+admin.site.register(RecipeIngredient, RecipeIngredientAdmin)
 admin.site.register(Favorite)
 admin.site.register(WishList)
+admin.site.register(ShoppingListIngredient)
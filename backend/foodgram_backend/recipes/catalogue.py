@@ -0,0 +1,111 @@
+from array import array
+from bisect import bisect_left, bisect_right
+
+from .changes import get_version
+from .models import Ingredients
+
+
+class IngredientIndex:
+    """
+    Индекс названий ингредиентов в памяти процесса.
+
+    Хранит названия в нижнем регистре отсортированным массивом:
+    совпадения по префиксу ищутся бинарным поиском, по подстроке —
+    через str.find по склеенным названиям.
+    """
+
+    def __init__(self, rows):
+        rows = sorted((name.lower(), pk) for pk, name in rows)
+        self.names = [name for name, _ in rows]
+        self.ids = [pk for _, pk in rows]
+        self.text = '\n'.join(self.names)
+        self.offsets = []
+        offset = 0
+        for name in self.names:
+            self.offsets.append(offset)
+            offset += len(name) + 1
+
+    def search(self, query, limit):
+        query = query.lower()
+        start = bisect_left(self.names, query)
+        end = start
+        while (
+            end < len(self.names) and end - start < limit
+            and self.names[end].startswith(query)
+        ):
+            end += 1
+        result = self.ids[start:end]
+        found = self.text.find(query)
+        while found != -1 and len(result) < limit:
+            pos = bisect_right(self.offsets, found) - 1
+            if found != self.offsets[pos]:
+                result.append(self.ids[pos])
+            if pos + 1 == len(self.offsets):
+                break
+            found = self.text.find(query, self.offsets[pos + 1])
+        return result
+
+
+class IngredientCatalogue:
+    """
+    Снимок справочника ингредиентов.
+
+    id лежат отсортированным массивом, названия и единицы измерения —
+    параллельными списками, поиск по id идёт бинарным поиском.
+    """
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        self.ids = array('q')
+        self.names = []
+        self.units = []
+        units = {}
+        for pk, name, unit in sorted(rows):
+            self.ids.append(pk)
+            self.names.append(name)
+            self.units.append(units.setdefault(unit, unit))
+        self.index = IngredientIndex(zip(self.ids, self.names))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, pk):
+        return self.position(pk) is not None
+
+    def position(self, pk):
+        pos = bisect_left(self.ids, pk)
+        if pos < len(self.ids) and self.ids[pos] == pk:
+            return pos
+        return None
+
+    def get(self, pk):
+        """Ингредиент в том виде, в каком его отдаёт API, или None."""
+        pos = self.position(pk)
+        if pos is None:
+            return None
+        return {
+            'id': pk,
+            'name': self.names[pos],
+            'measurement_unit': self.units[pos]
+        }
+
+    def all(self):
+        return [self.get(pk) for pk in self.ids]
+
+    def search(self, query, limit):
+        return [self.get(pk) for pk in self.index.search(query, limit)]
+
+
+_catalogue = None
+
+
+def get_catalogue():
+    """Справочник ингредиентов, перечитываемый при смене версии таблицы."""
+    global _catalogue
+    version, _ = get_version(Ingredients)
+    if _catalogue is None or _catalogue.version != version:
+        _catalogue = IngredientCatalogue(
+            Ingredients.objects.values_list('id', 'name', 'measurement_unit'),
+            version
+        )
+    return _catalogue
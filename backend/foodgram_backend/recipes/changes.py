@@ -0,0 +1,66 @@
+import time
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Состав и порядок ленты рецептов: меняется при создании и удалении
+# рецептов и при смене их тэгов.
+FEED_KEY = 'changes:feed'
+
+
+def get_key(model, pk=None):
+    key = f'changes:{model._meta.label_lower}'
+    if pk is None:
+        return key
+    return f'{key}:{pk}'
+
+
+def get_many(keys):
+    """
+    Версии по ключам: пары (токен, время изменения).
+
+    Версии хранятся в общем кэше, поэтому одинаковы во всех процессах.
+    Пропавшая из кэша версия создаётся заново со свежим токеном.
+    """
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, (uuid4().hex, time.time()), timeout=None)
+            versions[key] = cache.get(key)
+    return versions
+
+
+def get_versions(*models):
+    """Версии таблиц в порядке моделей."""
+    keys = [get_key(model) for model in models]
+    versions = get_many(keys)
+    return [versions[key] for key in keys]
+
+
+def get_version(model):
+    return get_versions(model)[0]
+
+
+def bump(*keys):
+    changed = time.time()
+    cache.set_many(
+        {key: (uuid4().hex, changed) for key in keys}, timeout=None
+    )
+
+
+def touch_keys(*keys):
+    """
+    Меняет версии по ключам.
+
+    Версия меняется сразу и ещё раз после коммита, чтобы процесс,
+    успевший прочитать данные до коммита, не закэшировал их под новой
+    версией.
+    """
+    bump(*keys)
+    transaction.on_commit(lambda: bump(*keys))
+
+
+def touch(model, *pks):
+    """Отмечает изменение таблицы и, если переданы, отдельных объектов."""
+    touch_keys(get_key(model), *(get_key(model, pk) for pk in pks))
@@ -0,0 +1,300 @@
+import threading
+from array import array
+from itertools import chain
+
+from django.conf import settings
+
+from .changes import get_many, touch_keys
+from .models import RecipeChange, RecipeIngredient
+
+VERSION_KEY = 'changes:cookable'
+
+
+def log_changes(*recipe_ids):
+    """
+    Записывает в журнал рецепты, у которых изменился состав.
+
+    Запись идёт в транзакции самого изменения, а версия индекса
+    меняется ещё раз после коммита, так что процессы подхватят
+    изменение, когда оно станет видно в базе.
+    """
+    changes = RecipeChange.objects.bulk_create(
+        RecipeChange(recipe=recipe_id) for recipe_id in recipe_ids
+    )
+    newest = max(change.pk for change in changes)
+    RecipeChange.objects.filter(
+        pk__lte=newest - settings.COOKABLE_LOG_SIZE
+    ).delete()
+    touch_keys(VERSION_KEY)
+
+
+def reset():
+    """Просит все процессы перестроить индекс целиком."""
+    log_changes(None)
+
+
+def popcount(mask):
+    return bin(mask).count('1')
+
+
+def to_mask(positions, length):
+    """Битовая маска из позиций: быстрее, чем |= 1 << pos по одной."""
+    bits = bytearray((length + 7) // 8)
+    for pos in positions:
+        bits[pos >> 3] |= 1 << (pos & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def add(planes, mask):
+    """Прибавляет 1 к счётчикам рецептов из mask, planes — разряды."""
+    carry = mask
+    for num, plane in enumerate(planes):
+        if not carry:
+            return
+        planes[num], carry = plane ^ carry, plane & carry
+    if carry:
+        planes.append(carry)
+
+
+def subtract(minuend, subtrahend):
+    """Поразрядная разность счётчиков, уменьшаемое не меньше вычитаемого."""
+    result = []
+    borrow = 0
+    for num in range(len(minuend)):
+        left = minuend[num]
+        right = subtrahend[num] if num < len(subtrahend) else 0
+        result.append(left ^ right ^ borrow)
+        borrow = (~left & right) | (~(left ^ right) & borrow)
+    return result
+
+
+class Ranking:
+    """
+    Рецепты-кандидаты по возрастанию числа недостающих ингредиентов,
+    при равенстве — от новых к старым.
+
+    Кандидаты разбиты на маски по числу недостающих, id достаются
+    только для запрошенного среза, начиная со старших битов. Элементы —
+    пары (id рецепта, сколько ингредиентов не хватает).
+    """
+
+    def __init__(self, candidates, missing, ids, max_missing=None):
+        self.ids = ids
+        self.levels = []
+        count = 0
+        while candidates and (max_missing is None or count <= max_missing):
+            mask = candidates
+            for num, plane in enumerate(missing):
+                mask &= plane if count >> num & 1 else ~plane
+            if mask:
+                self.levels.append((count, mask, popcount(mask)))
+                candidates &= ~mask
+            count += 1
+        self.length = sum(size for _, _, size in self.levels)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        start, stop, _ = item.indices(self.length)
+        wanted = max(stop - start, 0)
+        result = []
+        for count, mask, size in self.levels:
+            if len(result) >= wanted:
+                break
+            if start >= size:
+                start -= size
+                continue
+            while mask and len(result) < wanted:
+                pos = mask.bit_length() - 1
+                mask ^= 1 << pos
+                if start:
+                    start -= 1
+                else:
+                    result.append((self.ids[pos], count))
+            start = 0
+        return result
+
+
+class CookableIndex:
+    """
+    Индекс «что приготовить» в памяти процесса.
+
+    Рецепту соответствует бит, более новым — старшие. Для каждого
+    ингредиента хранится маска рецептов с ним (длинный int), число
+    ингредиентов рецептов — поразрядно: в sizes[k] взведены биты
+    рецептов, у которых k-й разряд числа равен 1. Совпадения с набором
+    пользователя считаются сложением масок как двоичных счётчиков сразу
+    для всех рецептов, без циклов по рецептам и без обращения к базе.
+
+    last и seen — последняя и недавно применённые записи журнала
+    RecipeChange: записи из окна COOKABLE_LOG_OVERLAP перечитываются,
+    чтобы не пропустить транзакции, закоммиченные позже соседних.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self.masks = {}
+        self.sizes = []
+        self.recipes = {}
+        self.positions = {}
+        self.ids = array('q')
+        self.last = 0
+        self.seen = set()
+
+    def load(self, rows):
+        recipes = {}
+        for recipe_id, ingredient_id in rows:
+            recipes.setdefault(recipe_id, []).append(ingredient_id)
+        postings = {}
+        sizes = {}
+        for pos, recipe_id in enumerate(sorted(recipes)):
+            ingredients = tuple(sorted(recipes[recipe_id]))
+            self.recipes[recipe_id] = ingredients
+            self.positions[recipe_id] = pos
+            self.ids.append(recipe_id)
+            for ingredient_id in ingredients:
+                postings.setdefault(ingredient_id, []).append(pos)
+            sizes[pos] = len(ingredients)
+        length = len(self.ids)
+        self.masks = {
+            ingredient_id: to_mask(positions, length)
+            for ingredient_id, positions in postings.items()
+        }
+        self.sizes = [
+            to_mask(
+                (pos for pos, size in sizes.items() if size >> num & 1),
+                length
+            )
+            for num in range(max(sizes.values(), default=0).bit_length())
+        ]
+
+    def set_recipe(self, recipe_id, ingredients):
+        ingredients = tuple(sorted(ingredients))
+        old = self.recipes.pop(recipe_id, ())
+        if ingredients:
+            self.recipes[recipe_id] = ingredients
+        if old == ingredients:
+            return
+        pos = self.positions.get(recipe_id)
+        if pos is None:
+            pos = self.positions[recipe_id] = len(self.ids)
+            self.ids.append(recipe_id)
+        bit = 1 << pos
+        for ingredient_id in old:
+            mask = self.masks[ingredient_id] & ~bit
+            if mask:
+                self.masks[ingredient_id] = mask
+            else:
+                del self.masks[ingredient_id]
+        for ingredient_id in ingredients:
+            self.masks[ingredient_id] = self.masks.get(ingredient_id, 0) | bit
+        size = len(ingredients)
+        while len(self.sizes) < size.bit_length():
+            self.sizes.append(0)
+        for num, plane in enumerate(self.sizes):
+            if size >> num & 1:
+                self.sizes[num] = plane | bit
+            else:
+                self.sizes[num] = plane & ~bit
+
+    def rank(self, ingredients, max_missing=None):
+        """
+        Рецепты, где есть хоть один ингредиент из набора: сначала те,
+        что можно приготовить целиком, затем с наименьшим числом
+        недостающих.
+        """
+        candidates = 0
+        matched = []
+        for ingredient_id in set(ingredients):
+            mask = self.masks.get(ingredient_id)
+            if mask:
+                candidates |= mask
+                add(matched, mask)
+        return Ranking(
+            candidates, subtract(self.sizes, matched), self.ids, max_missing
+        )
+
+
+def load_changes(recipe_ids):
+    ingredients = {recipe_id: [] for recipe_id in recipe_ids}
+    for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'ingredient_id'):
+        ingredients[recipe_id].append(ingredient_id)
+    return ingredients
+
+
+def build(version):
+    """Индекс целиком; журнал читается до данных, а не после."""
+    index = CookableIndex(version)
+    index.seen = set(RecipeChange.objects.order_by('-pk').values_list(
+        'pk', flat=True
+    )[:settings.COOKABLE_LOG_OVERLAP])
+    index.last = max(index.seen, default=0)
+    index.load(RecipeIngredient.objects.values_list(
+        'recipe_id', 'ingredient_id'
+    ).iterator(chunk_size=10000))
+    return index
+
+
+def sync(index, version):
+    """
+    Применяет к индексу новые записи журнала.
+
+    Если среди них есть просьба перестроить всё или записей так много,
+    что часть могла уже удалиться из журнала, индекс строится заново.
+    """
+    overlap = settings.COOKABLE_LOG_OVERLAP
+    fresh = [
+        (pk, recipe_id)
+        for pk, recipe_id in RecipeChange.objects.filter(
+            pk__gt=index.last - overlap
+        ).values_list('pk', 'recipe')
+        if pk not in index.seen
+    ]
+    newest = max((pk for pk, _ in fresh), default=index.last)
+    if (
+        newest - index.last > settings.COOKABLE_LOG_SIZE // 2
+        or any(recipe_id is None for _, recipe_id in fresh)
+    ):
+        return build(version)
+    changed = {recipe_id for _, recipe_id in fresh}
+    if changed:
+        for recipe_id, ingredients in load_changes(changed).items():
+            index.set_recipe(recipe_id, ingredients)
+    index.last = max(index.last, newest)
+    index.seen = {
+        pk for pk in chain(index.seen, (pk for pk, _ in fresh))
+        if pk > index.last - overlap
+    }
+    index.version = version
+    return index
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_index():
+    """Индекс, догоняющий журнал при смене версии VERSION_KEY."""
+    global _index
+    version = get_many([VERSION_KEY])[VERSION_KEY]
+    if _index is None:
+        _index = build(version)
+    elif _index.version != version:
+        _index = sync(_index, version)
+    return _index
+
+
+def rank(ingredients, max_missing=None):
+    """
+    CookableIndex.rank по актуальному индексу.
+
+    Индекс меняется на месте, поэтому синхронизация и подсчёт идут
+    под блокировкой.
+    """
+    with _lock:
+        return get_index().rank(ingredients, max_missing)
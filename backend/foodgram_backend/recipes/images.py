@@ -0,0 +1,150 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from .changes import touch
+from .models import Recipes
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS = {
+    'thumbnail': (300, 300),
+    'card': (800, 800),
+    'full': (1920, 1920),
+}
+RENDITIONS_DIR = 'recipes/images/renditions/'
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            thread_name_prefix='images'
+        )
+    return _executor
+
+
+def get_image_url(recipe, rendition):
+    """
+    Адрес версии изображения рецепта.
+
+    Пока версии для текущего изображения не готовы, отдаётся оригинал.
+    """
+    return get_url(recipe.image.name, recipe.renditions, rendition)
+
+
+def get_url(image, renditions, rendition):
+    """То же, что get_image_url, по имени файла и полю renditions."""
+    renditions = renditions or {}
+    if renditions.get('source') == image and rendition in renditions:
+        return default_storage.url(renditions[rendition])
+    if not image:
+        return None
+    return default_storage.url(image)
+
+
+def is_stale(image, renditions):
+    """Версий нет, не хватает или они сделаны для другого изображения."""
+    renditions = renditions or {}
+    return bool(image) and (
+        renditions.get('source') != image
+        or not RENDITIONS.keys() <= renditions.keys()
+    )
+
+
+def get_files(renditions):
+    """Файлы версий без исходного изображения."""
+    return {
+        name for key, name in (renditions or {}).items() if key != 'source'
+    }
+
+
+def delete_files(names):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except OSError:
+            logger.exception('Failed to delete rendition %s', name)
+
+
+def render(image, size):
+    image = image.copy()
+    image.thumbnail(size, Image.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=85, optimize=True, progressive=True)
+    return ContentFile(buffer.getvalue())
+
+
+def make_renditions(recipe_id, image_name):
+    """
+    Пережимает изображение во все версии и сохраняет их в рецепт.
+
+    Файлы прежних версий удаляются после коммита. Если изображение
+    рецепта успели заменить, новые файлы удаляются сразу и
+    возвращается False.
+    """
+    with default_storage.open(image_name) as f:
+        image = ImageOps.exif_transpose(Image.open(f))
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    renditions = {'source': image_name}
+    for name, size in RENDITIONS.items():
+        renditions[name] = default_storage.save(
+            f'{RENDITIONS_DIR}{stem}_{name}.jpg', render(image, size)
+        )
+    with transaction.atomic():
+        previous = Recipes.objects.select_for_update().filter(
+            pk=recipe_id, image=image_name
+        ).values_list('renditions', flat=True).first()
+        if previous is not None:
+            Recipes.objects.filter(pk=recipe_id).update(
+                renditions=renditions
+            )
+    if previous is None:
+        delete_files(get_files(renditions))
+        return False
+    superseded = get_files(previous) - get_files(renditions)
+    transaction.on_commit(lambda: delete_files(superseded))
+    touch(Recipes, recipe_id)
+    return True
+
+
+def run_task(recipe_id, image_name):
+    try:
+        make_renditions(recipe_id, image_name)
+    except Exception:
+        logger.exception(
+            'Failed to make renditions of recipe %s', recipe_id
+        )
+    finally:
+        connections.close_all()
+
+
+def schedule_renditions(recipe):
+    """
+    Ставит в очередь пережатие изображения рецепта.
+
+    Задача уходит в пул потоков после коммита, чтобы запрос не ждал
+    обработки. С IMAGE_RENDITIONS_ASYNC = False версии делаются сразу.
+    """
+    args = (recipe.pk, recipe.image.name)
+    if not settings.IMAGE_RENDITIONS_ASYNC:
+        make_renditions(*args)
+        return
+    transaction.on_commit(lambda: get_executor().submit(run_task, *args))
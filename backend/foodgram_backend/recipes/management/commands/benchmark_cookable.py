@@ -0,0 +1,182 @@
+import random
+import statistics
+import time
+import tracemalloc
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, Q
+
+from recipes.cookable import CookableIndex, build
+from recipes.models import Ingredients, Recipes
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the "what can I cook" index: build time, memory, '
+        'ranking and incremental update latency, optionally against the '
+        'equivalent SQL query'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--synthetic',
+            type=int,
+            help='build the index from this many random recipes instead of '
+                 'the database'
+        )
+        parser.add_argument(
+            '--ingredients',
+            type=int,
+            default=2000,
+            help='ingredient catalogue size for --synthetic'
+        )
+        parser.add_argument(
+            '--per-recipe',
+            type=int,
+            default=8,
+            help='ingredients per recipe for --synthetic'
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=200,
+            help='ranking queries to run'
+        )
+        parser.add_argument(
+            '--set-size',
+            type=int,
+            default=10,
+            help='ingredients the user has in each query'
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=6
+        )
+        parser.add_argument(
+            '--db',
+            action='store_true',
+            help='also run the SQL join query and check it returns the '
+                 'same first page'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def get_weights(self, count):
+        """
+        Накопленные веса популярности ингредиентов по закону Ципфа:
+        соль встречается чаще шафрана.
+        """
+        return list(accumulate(1 / (rank + 1) for rank in range(count)))
+
+    def synthetic_rows(self, options, rng):
+        ingredients = list(range(1, options['ingredients'] + 1))
+        weights = self.get_weights(len(ingredients))
+        for recipe_id in range(1, options['synthetic'] + 1):
+            chosen = set(rng.choices(
+                ingredients, cum_weights=weights, k=options['per_recipe']
+            ))
+            for ingredient_id in chosen:
+                yield recipe_id, ingredient_id
+
+    def sql_rank(self, ingredients, limit):
+        return list(Recipes.objects.annotate(
+            total=Count('recipeingredient'),
+            matched=Count(
+                'recipeingredient',
+                filter=Q(recipeingredient__ingredient_id__in=ingredients)
+            )
+        ).filter(matched__gt=0).annotate(
+            missing=F('total') - F('matched')
+        ).order_by('missing', '-id').values_list(
+            'id', 'missing'
+        )[:limit])
+
+    def report(self, label, timings):
+        if len(timings) > 1:
+            p50, p95 = (
+                statistics.quantiles(timings, n=100, method='inclusive')[num]
+                for num in (49, 94)
+            )
+        else:
+            p50 = p95 = timings[0]
+        self.stdout.write(
+            f'{label}: p50 {p50 * 1e3:.2f} ms, p95 {p95 * 1e3:.2f} ms'
+        )
+
+    def handle(self, *args, **options):
+        if options['queries'] < 1 or options['set_size'] < 1:
+            raise CommandError('--queries and --set-size must be positive')
+        if options['synthetic'] is not None and options['db']:
+            raise CommandError('--db compares with database recipes only')
+        rng = random.Random(options['seed'])
+        tracemalloc.start()
+        started = time.perf_counter()
+        if options['synthetic'] is not None:
+            index = CookableIndex()
+            index.load(self.synthetic_rows(options, rng))
+            ingredients = list(range(1, options['ingredients'] + 1))
+        else:
+            index = build(None)
+            ingredients = list(
+                Ingredients.objects.order_by('pk').values_list(
+                    'pk', flat=True
+                )
+            )
+        elapsed = time.perf_counter() - started
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        if not index.recipes:
+            raise CommandError('No recipes, run seed_data or use --synthetic')
+        self.stdout.write(
+            f'index of {len(index.recipes)} recipes and '
+            f'{len(index.masks)} ingredients built in {elapsed:.2f} s, '
+            f'{size / 2 ** 20:.1f} MiB'
+        )
+        weights = self.get_weights(len(ingredients))
+        queries = [
+            rng.choices(
+                ingredients, cum_weights=weights, k=options['set_size']
+            )
+            for _ in range(options['queries'])
+        ]
+        page_size = options['page_size']
+        timings, candidates, pages = [], [], []
+        for query in queries:
+            started = time.perf_counter()
+            ranking = index.rank(query)
+            pages.append(ranking[:page_size])
+            timings.append(time.perf_counter() - started)
+            candidates.append(len(ranking))
+        self.stdout.write(
+            f'{options["queries"]} queries of {options["set_size"]} '
+            f'ingredients, {statistics.mean(candidates):.0f} candidate '
+            f'recipes on average'
+        )
+        self.report('index, first page', timings)
+
+        recipe_ids = list(index.recipes)
+        timings = []
+        for _ in range(min(options['queries'], len(recipe_ids))):
+            recipe_id = rng.choice(recipe_ids)
+            new = rng.sample(ingredients, min(
+                len(index.recipes[recipe_id]), len(ingredients)
+            ))
+            started = time.perf_counter()
+            index.set_recipe(recipe_id, new)
+            timings.append(time.perf_counter() - started)
+        self.report('incremental update of one recipe', timings)
+
+        if options['db']:
+            index = build(None)
+            timings = []
+            for query, page in zip(queries, pages):
+                started = time.perf_counter()
+                rows = self.sql_rank(query, page_size)
+                timings.append(time.perf_counter() - started)
+                if rows != index.rank(query)[:page_size]:
+                    raise CommandError(
+                        f'SQL and index disagree for {sorted(set(query))}'
+                    )
+            self.report('SQL join, first page', timings)
+            self.stdout.write(self.style.SUCCESS('First pages are identical'))
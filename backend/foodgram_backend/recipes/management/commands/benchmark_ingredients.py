@@ -0,0 +1,71 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.catalogue import IngredientIndex
+from recipes.models import Ingredients
+from recipes.search import search_ingredients
+
+
+class Command(BaseCommand):
+    help = 'Benchmark ingredient autocomplete over the ingredients catalogue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            type=str,
+            default=str(settings.BASE_DIR / 'data' / 'ingredients.json'),
+            help='file path'
+        )
+        parser.add_argument(
+            '--db',
+            action='store_true',
+            help='also benchmark search against the database'
+        )
+
+    def get_queries(self, names):
+        """Префиксы длиной 1-3 и подстроки, как их набирает пользователь."""
+        queries = set()
+        for name in names:
+            queries.update(name[:length] for length in (1, 2, 3))
+            if len(name) > 4:
+                queries.add(name[2:5])
+        return sorted(queries)
+
+    def report(self, label, timings):
+        timings.sort()
+        total = sum(timings)
+        self.stdout.write(
+            f'{label}: {len(timings)} queries, '
+            f'avg {total / len(timings) * 1e6:.1f} us, '
+            f'p95 {timings[int(len(timings) * 0.95)] * 1e6:.1f} us'
+        )
+
+    def handle(self, *args, **options):
+        with open(options['path'], encoding='utf-8') as f:
+            names = [line['name'] for line in json.load(f)]
+        limit = settings.INGREDIENTS_SEARCH_LIMIT
+        started = time.perf_counter()
+        index = IngredientIndex(enumerate(names))
+        self.stdout.write(
+            f'index of {len(names)} ingredients built in '
+            f'{(time.perf_counter() - started) * 1e3:.1f} ms'
+        )
+        queries = self.get_queries(names)
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, limit)
+            timings.append(time.perf_counter() - started)
+        self.report('in-process index', timings)
+        if options['db']:
+            timings = []
+            for query in queries:
+                started = time.perf_counter()
+                list(search_ingredients(Ingredients.objects.all(), query)[
+                    :limit
+                ])
+                timings.append(time.perf_counter() - started)
+            self.report('database', timings)
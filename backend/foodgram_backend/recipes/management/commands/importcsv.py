@@ -1,26 +1,155 @@
+import csv
 import json
+import time
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
+from recipes.changes import touch
 from recipes.models import Ingredients
 
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_json(file):
+    """Потоково читает JSON-массив объектов, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if not started and buffer:
+            if buffer[0] != '[':
+                raise CommandError('JSON file must contain an array')
+            buffer = buffer[1:]
+            started = True
+            continue
+        if buffer.startswith(']'):
+            return
+        if started and buffer:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise CommandError('Malformed JSON file')
+            else:
+                buffer = buffer[end:]
+                yield item
+                continue
+        if eof:
+            return
+        chunk = file.read(CHUNK_SIZE)
+        eof = not chunk
+        buffer += chunk
+
+
+def iter_csv(file):
+    """Читает строки «название,единица», пропуская заголовок."""
+    for row in csv.reader(file):
+        if len(row) < 2:
+            continue
+        name, measurement_unit = row[0].strip(), row[1].strip()
+        if name == 'name':
+            continue
+        yield {'name': name, 'measurement_unit': measurement_unit}
+
 
 class Command(BaseCommand):
-    help = 'Import from .csv file to .postgresql'
+    help = 'Import ingredients from a .json or .csv file'
 
     def add_arguments(self, parser):
         parser.add_argument("--path", type=str, help="file path")
+        parser.add_argument(
+            '--format',
+            choices=('json', 'csv'),
+            help='file format, detected by extension by default'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='rows per INSERT'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='only report what would be imported'
+        )
+
+    def read_rows(self, file, file_format):
+        rows = iter_json(file) if file_format == 'json' else iter_csv(file)
+        seen = set()
+        self.total = self.duplicates = 0
+        for line in rows:
+            self.total += 1
+            key = (line['name'].strip(), line['measurement_unit'].strip())
+            if key in seen:
+                self.duplicates += 1
+                continue
+            seen.add(key)
+            yield key
+
+    def report_progress(self, processed, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{processed} rows, {processed / elapsed if elapsed else 0:.0f} '
+            f'rows/s'
+        )
+
+    def dry_run(self, rows):
+        existing = set(
+            Ingredients.objects.values_list('name', 'measurement_unit')
+        )
+        new = [row for row in rows if row not in existing]
+        for name, measurement_unit in new:
+            self.stdout.write(f'+ {name}, {measurement_unit}')
+        self.stdout.write(
+            f'{self.total} rows read, {self.duplicates} duplicates in file, '
+            f'{len(new)} new, {self.total - self.duplicates - len(new)} '
+            f'already present'
+        )
+
+    def import_rows(self, rows, batch_size):
+        before = Ingredients.objects.count()
+        started = time.perf_counter()
+        batch = []
+        processed = 0
+        for name, measurement_unit in rows:
+            batch.append(Ingredients(
+                name=name, measurement_unit=measurement_unit
+            ))
+            if len(batch) >= batch_size:
+                Ingredients.objects.bulk_create(batch, ignore_conflicts=True)
+                processed += len(batch)
+                batch = []
+                self.report_progress(processed, started)
+        if batch:
+            Ingredients.objects.bulk_create(batch, ignore_conflicts=True)
+            processed += len(batch)
+            self.report_progress(processed, started)
+        touch(Ingredients)
+        created = Ingredients.objects.count() - before
+        self.stdout.write(self.style.SUCCESS(
+            f'{self.total} rows read, {self.duplicates} duplicates in file, '
+            f'{created} ingredients created in '
+            f'{time.perf_counter() - started:.2f} s'
+        ))
 
     def handle(self, *args, **options):
         file_path = options["path"]
-        with open(file_path, encoding='utf-8') as f:
-            jsondata = json.load(f)
-            for line in jsondata:
-                if not Ingredients.objects.filter(
-                        name=line['name'],
-                        measurement_unit=line[
-                            'measurement_unit']).exists():
-                    Ingredients.objects.create(
-                        name=line['name'],
-                        measurement_unit=line['measurement_unit']
-                    )
+        if not file_path:
+            raise CommandError('--path is required')
+        file_format = options['format'] or Path(file_path).suffix.lstrip(
+            '.'
+        ).lower()
+        if file_format not in ('json', 'csv'):
+            raise CommandError('Unknown file format, use --format')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        with open(file_path, encoding='utf-8', newline='') as f:
+            rows = self.read_rows(f, file_format)
+            if options['dry_run']:
+                self.dry_run(rows)
+            else:
+                self.import_rows(rows, options['batch_size'])
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import is_stale, make_renditions
+from recipes.models import Recipes
+
+
+class Command(BaseCommand):
+    help = (
+        'Make image renditions of recipes whose renditions are missing '
+        'or were made for a previous image, e.g. when a worker restarted '
+        'before its queued job ran'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='remake renditions of every recipe with an image'
+        )
+
+    def handle(self, *args, **options):
+        made = failed = 0
+        recipes = Recipes.objects.exclude(image='').values_list(
+            'pk', 'image', 'renditions'
+        ).order_by('pk')
+        for recipe_id, image, renditions in recipes.iterator():
+            if not options['all'] and not is_stale(image, renditions):
+                continue
+            try:
+                made += make_renditions(recipe_id, image)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'Recipe {recipe_id}: {error}')
+        self.stdout.write(
+            f'Made renditions of {made} recipes, {failed} failed'
+        )
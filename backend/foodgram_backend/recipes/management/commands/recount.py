@@ -0,0 +1,52 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipes, WishList
+from recipes import cookable
+from recipes.search import update_search_vectors
+from recipes.shopping_list import rebuild
+from users.models import Subscription
+
+User = get_user_model()
+
+
+def count_by(model, field):
+    """Подзапрос с числом строк model, ссылающихся на текущий объект."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+                field
+            ).annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute favorites, cart, recipes and followers counters, '
+        'rebuild shopping lists, recipe search vectors and the '
+        '"what can I cook" index'
+    )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        recipes = Recipes.objects.update(
+            favorites_count=count_by(Favorite, 'recipe'),
+            shopping_cart_count=count_by(WishList, 'recipe')
+        )
+        users = User.objects.update(
+            recipes_count=count_by(Recipes, 'author'),
+            followers_count=count_by(Subscription, 'author')
+        )
+        rows = rebuild()
+        vectors = update_search_vectors()
+        cookable.reset()
+        self.stdout.write(
+            f'Recounted counters of {recipes} recipes and {users} users, '
+            f'rebuilt {rows} shopping list rows and {vectors} search vectors'
+        )
@@ -0,0 +1,225 @@
+import random
+import time
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from recipes import membership
+from recipes.changes import FEED_KEY, touch, touch_keys
+from recipes.models import (
+    Tags,
+    Ingredients,
+    Recipes,
+    RecipeIngredient,
+    Favorite,
+    WishList
+)
+from users.models import Subscription
+
+User = get_user_model()
+
+PASSWORD = 'seed-password'
+IMAGE_NAME = 'recipes/images/seed.jpg'
+
+
+def sample(rng, population, count):
+    return rng.sample(population, min(count, len(population)))
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a deterministic synthetic dataset of users, recipes, '
+        'favorites, carts and subscriptions for load testing'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8
+        )
+        parser.add_argument(
+            '--ingredients',
+            type=int,
+            default=500,
+            help='synthetic ingredients to create when the catalogue '
+                 'has fewer'
+        )
+        parser.add_argument('--tags', type=int, default=6)
+        parser.add_argument(
+            '--favorites', type=int, default=20, help='per user'
+        )
+        parser.add_argument('--carts', type=int, default=5, help='per user')
+        parser.add_argument(
+            '--subscriptions', type=int, default=10, help='per user'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--prefix',
+            default='seed',
+            help='prefix of generated usernames and tag slugs'
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='delete a previously generated dataset first'
+        )
+
+    def bulk_create(self, model, objs):
+        created = model.objects.bulk_create(objs, batch_size=self.batch_size)
+        self.stdout.write(f'{model.__name__}: {len(created)}')
+        return created
+
+    def get_image(self):
+        if not default_storage.exists(IMAGE_NAME):
+            buffer = BytesIO()
+            Image.new('RGB', (800, 600), '#c86432').save(buffer, 'JPEG')
+            default_storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+        return IMAGE_NAME
+
+    def get_ingredients(self, count):
+        missing = count - Ingredients.objects.count()
+        if missing > 0:
+            self.bulk_create(Ingredients, [
+                Ingredients(
+                    name=f'{self.prefix} ингредиент {num}',
+                    measurement_unit=('г', 'мл', 'шт')[num % 3]
+                )
+                for num in range(missing)
+            ])
+        return list(
+            Ingredients.objects.order_by('pk').values_list('pk', flat=True)
+        )
+
+    def create_users(self, count):
+        password = make_password(PASSWORD)
+        return self.bulk_create(User, [
+            User(
+                username=f'{self.prefix}{num}',
+                email=f'{self.prefix}{num}@example.com',
+                first_name=f'Имя{num}',
+                last_name=f'Фамилия{num}',
+                password=password
+            )
+            for num in range(count)
+        ])
+
+    def create_tags(self, count):
+        return self.bulk_create(Tags, [
+            Tags(
+                name=f'Тэг {num}',
+                slug=f'{self.prefix}-tag-{num}',
+                color='#{:06x}'.format(self.rng.randrange(0x1000000))
+            )
+            for num in range(count)
+        ])
+
+    def create_recipes(self, options, users, tags, ingredients):
+        image = self.get_image()
+        recipes = self.bulk_create(Recipes, [
+            Recipes(
+                author=self.rng.choice(users),
+                name=f'Рецепт {num}',
+                text=f'Описание рецепта {num}. ' * 5,
+                cooking_time=self.rng.randint(5, 180),
+                image=image
+            )
+            for num in range(options['recipes'])
+        ])
+        tag_links, ingredient_links, amounts = [], [], []
+        for recipe in recipes:
+            for tag in sample(self.rng, tags, self.rng.randint(1, 3)):
+                tag_links.append(
+                    Recipes.tags.through(recipes_id=recipe.pk, tags_id=tag.pk)
+                )
+            for ingredient_id in sample(
+                self.rng, ingredients, options['ingredients_per_recipe']
+            ):
+                ingredient_links.append(Recipes.ingredients.through(
+                    recipes_id=recipe.pk, ingredients_id=ingredient_id
+                ))
+                amounts.append(RecipeIngredient(
+                    recipe_id=recipe.pk,
+                    ingredient_id=ingredient_id,
+                    amount=self.rng.randint(1, 500)
+                ))
+        self.bulk_create(Recipes.tags.through, tag_links)
+        self.bulk_create(Recipes.ingredients.through, ingredient_links)
+        self.bulk_create(RecipeIngredient, amounts)
+        return recipes
+
+    def create_relations(self, options, users, recipes):
+        favorites, carts, subscriptions = [], [], []
+        for user in users:
+            favorites.extend(
+                Favorite(user=user, recipe=recipe)
+                for recipe in sample(self.rng, recipes, options['favorites'])
+            )
+            carts.extend(
+                WishList(user=user, recipe=recipe)
+                for recipe in sample(self.rng, recipes, options['carts'])
+            )
+            subscriptions.extend(
+                Subscription(user=user, author=author)
+                for author in sample(
+                    self.rng, users, options['subscriptions'] + 1
+                )
+                if author != user
+            )
+        self.bulk_create(Favorite, favorites)
+        self.bulk_create(WishList, carts)
+        self.bulk_create(Subscription, subscriptions)
+
+    def clear(self):
+        users = User.objects.filter(username__startswith=self.prefix)
+        tags = Tags.objects.filter(slug__startswith=f'{self.prefix}-tag-')
+        self.stdout.write(
+            f'Deleting {users.count()} users and {tags.count()} tags'
+        )
+        users.delete()
+        tags.delete()
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.prefix = options['prefix']
+        self.batch_size = options['batch_size']
+        if options['users'] < 1:
+            raise CommandError('--users must be positive')
+        if options['clear']:
+            self.clear()
+        elif User.objects.filter(username__startswith=self.prefix).exists():
+            raise CommandError(
+                f'Users with prefix "{self.prefix}" exist, use --clear'
+            )
+        started = time.perf_counter()
+        ingredients = self.get_ingredients(options['ingredients'])
+        users = self.create_users(options['users'])
+        tags = self.create_tags(options['tags'])
+        recipes = self.create_recipes(options, users, tags, ingredients)
+        self.create_relations(options, users, recipes)
+        # bulk_create не шлёт сигналов: счётчики, списки покупок
+        # и версии для кэша пересчитываются отдельно.
+        call_command('recount', stdout=self.stdout)
+        touch(Tags)
+        touch(Ingredients)
+        touch(Recipes)
+        touch(RecipeIngredient)
+        touch(Favorite)
+        touch(WishList)
+        touch(Subscription)
+        touch(User)
+        touch_keys(FEED_KEY)
+        membership.invalidate(*(user.pk for user in users))
+        self.stdout.write(self.style.SUCCESS(
+            f'Dataset generated in {time.perf_counter() - started:.1f} s, '
+            f'password of every user is "{PASSWORD}"'
+        ))
@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from users.models import Subscription
+from .changes import get_many, touch_keys
+from .models import Favorite, WishList
+
+
+def get_key(user_id):
+    return f'membership:{user_id}'
+
+
+def get_version_key(user_id):
+    return f'changes:membership:{user_id}'
+
+
+class Membership:
+    """Id авторов в подписках, рецептов в избранном и в корзине."""
+
+    def __init__(self, authors=(), favorites=(), shopping_cart=()):
+        self.authors = frozenset(authors)
+        self.favorites = frozenset(favorites)
+        self.shopping_cart = frozenset(shopping_cart)
+
+
+def load(user_id):
+    return Membership(
+        Subscription.objects.filter(
+            user_id=user_id
+        ).values_list('author_id', flat=True),
+        Favorite.objects.filter(
+            user_id=user_id
+        ).values_list('recipe_id', flat=True),
+        WishList.objects.filter(
+            user_id=user_id
+        ).values_list('recipe_id', flat=True),
+    )
+
+
+def get_membership(user_id):
+    """
+    Множества пользователя, при MEMBERSHIP_CACHE — из общего кэша.
+
+    Запись в кэше хранится вместе с версией, прочитанной до запросов
+    в базу, и считается устаревшей, как только версия изменилась.
+    """
+    if not settings.MEMBERSHIP_CACHE:
+        return load(user_id)
+    version_key = get_version_key(user_id)
+    version = get_many([version_key])[version_key]
+    entry = cache.get(get_key(user_id))
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    membership = load(user_id)
+    cache.set(
+        get_key(user_id),
+        (version, membership),
+        settings.MEMBERSHIP_CACHE_TIMEOUT
+    )
+    return membership
+
+
+def invalidate(*user_ids):
+    touch_keys(*(get_version_key(user_id) for user_id in user_ids))
@@ -1,5 +1,6 @@
 from .utils import slugify
 
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import (
@@ -98,6 +99,11 @@ class Recipes(models.Model):
         default=None,
         blank=False
     )
+    renditions = models.JSONField(
+        verbose_name='Версии изображения',
+        default=dict,
+        editable=False
+    )
     name = models.CharField(
         verbose_name='Название рецепта',
         max_length=256,
@@ -122,11 +128,40 @@ class Recipes(models.Model):
         auto_now_add=True,
         verbose_name='Дата создания'
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        verbose_name='В списках покупок',
+        default=0,
+        editable=False
+    )
+    # Название, ингредиенты и описание для полнотекстового поиска,
+    # заполняется только на PostgreSQL, см. recipes.search.
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False
+    )
 
     class Meta:
+        # Пары полей из unique-ограничений избранного, корзины и подписок
+        # уже дают индексы с пользователем на первом месте.
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipes_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipes_author_pub_date_idx'
+            ),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
 
     def __str__(self):
         return self.name
@@ -223,3 +258,51 @@ class WishList(models.Model):
 
     def __str__(self):
         return f'{self.user} - {self.recipe}'
+
+
+class ShoppingListIngredient(models.Model):
+    """
+    Строка списка покупок пользователя: ингредиент и его суммарное
+    количество по всем рецептам в корзине.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_list',
+    )
+    ingredient = models.ForeignKey(
+        Ingredients,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField('Количество')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='user_shopping_list_ingredient_unique'
+            )
+        ]
+        verbose_name = 'Ингредиент списка покупок'
+        verbose_name_plural = 'Ингредиенты списков покупок'
+
+    def __str__(self):
+        return f'{self.user} - {self.ingredient}'
+
+
+class RecipeChange(models.Model):
+    """
+    Журнал изменений состава рецептов для индекса «что приготовить».
+
+    Пустой recipe означает, что индекс нужно перестроить целиком.
+    """
+    recipe = models.PositiveIntegerField('Рецепт', null=True)
+
+    class Meta:
+        verbose_name = 'Изменение состава рецепта'
+        verbose_name_plural = 'Изменения состава рецептов'
+
+    def __str__(self):
+        return f'{self.pk}: {self.recipe}'
@@ -0,0 +1,203 @@
+import re
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector
+)
+from django.db import connection
+from django.db.models import (
+    Case, F, IntegerField, OuterRef, Subquery, Value, When
+)
+
+from .catalogue import get_catalogue
+from .changes import get_versions
+from .models import Ingredients, RecipeIngredient, Recipes
+
+TRIGRAM_INDEXES = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS ingredient_name_prefix_idx '
+    'ON recipes_ingredients (UPPER(name) text_pattern_ops)',
+    'CREATE INDEX IF NOT EXISTS ingredient_name_trgm_idx '
+    'ON recipes_ingredients USING gin (UPPER(name) gin_trgm_ops)',
+)
+SEARCH_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS recipes_search_vector_idx '
+    'ON recipes_recipes USING gin (search_vector)',
+)
+
+
+def search_ingredients(queryset, query):
+    """
+    Поиск ингредиентов для автодополнения.
+
+    Сначала идут совпадения по началу названия, затем по подстроке,
+    внутри групп — по алфавиту. На PostgreSQL поиск идёт по индексам
+    из TRIGRAM_INDEXES, на остальных базах — по индексу справочника
+    в памяти процесса, если он не выключен INGREDIENTS_CATALOGUE_CACHE.
+    """
+    limit = settings.INGREDIENTS_SEARCH_LIMIT
+    if (
+        connection.vendor == 'postgresql'
+        or not settings.INGREDIENTS_CATALOGUE_CACHE
+    ):
+        return queryset.filter(name__icontains=query).annotate(
+            rank=Case(
+                When(name__istartswith=query, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField()
+            )
+        ).order_by('rank', 'name')
+    return order_by_ids(queryset, get_catalogue().index.search(query, limit))
+
+
+def order_by_ids(queryset, ids):
+    """Объекты с id из списка в его порядке."""
+    if not ids:
+        return queryset.none()
+    return queryset.filter(id__in=ids).order_by(Case(
+        *[When(id=pk, then=Value(pos)) for pos, pk in enumerate(ids)],
+        output_field=IntegerField()
+    ))
+
+
+def get_search_vector():
+    """
+    Вектор рецепта: название с весом A, названия ингредиентов — B,
+    описание — C.
+    """
+    config = settings.RECIPE_SEARCH_CONFIG
+    ingredients = Subquery(
+        RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+    )
+    return (
+        SearchVector('name', weight='A', config=config)
+        + SearchVector(ingredients, weight='B', config=config)
+        + SearchVector('text', weight='C', config=config)
+    )
+
+
+def update_search_vectors(recipe_ids=None):
+    """
+    Пересчитывает поисковые векторы рецептов, без аргумента — всех.
+
+    Вне PostgreSQL ничего не делает: там поиск идёт по RecipeIndex.
+    """
+    if connection.vendor != 'postgresql':
+        return 0
+    recipes = Recipes.objects.all()
+    if recipe_ids is not None:
+        recipes = recipes.filter(pk__in=recipe_ids)
+    return recipes.update(search_vector=get_search_vector())
+
+
+def tokenize(text):
+    return re.findall(r'\w+', text.lower())
+
+
+class RecipeIndex:
+    """
+    Обратный индекс рецептов в памяти процесса.
+
+    Для каждого слова хранит {id рецепта: вес}, вес — сумма весов
+    вхождений слова по полям, как у ts_rank: название 1, ингредиенты
+    0.4, описание 0.2. Слова лежат отсортированным списком, и слово
+    запроса совпадает со всеми словами, которые с него начинаются, —
+    грубая замена стемминга PostgreSQL.
+    """
+    WEIGHTS = {'name': 1.0, 'ingredients': 0.4, 'text': 0.2}
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        postings = {}
+        for pk, field, text in rows:
+            weight = self.WEIGHTS[field]
+            for word in tokenize(text):
+                scores = postings.setdefault(word, Counter())
+                scores[pk] += weight
+        self.words = sorted(postings)
+        self.postings = [postings[word] for word in self.words]
+
+    def match(self, term):
+        scores = Counter()
+        pos = bisect_left(self.words, term)
+        while pos < len(self.words) and self.words[pos].startswith(term):
+            scores.update(self.postings[pos])
+            pos += 1
+        return scores
+
+    def search(self, query):
+        """id рецептов со всеми словами запроса, по убыванию веса."""
+        scores = None
+        for term in set(tokenize(query)):
+            matched = self.match(term)
+            if scores is None:
+                scores = matched
+            else:
+                scores = {
+                    pk: score + matched[pk]
+                    for pk, score in scores.items() if pk in matched
+                }
+            if not scores:
+                return []
+        if scores is None:
+            return []
+        return sorted(scores, key=lambda pk: (-scores[pk], -pk))
+
+
+def load_recipe_index(version=None):
+    rows = []
+    for pk, name, text in Recipes.objects.values_list('id', 'name', 'text'):
+        rows.append((pk, 'name', name))
+        rows.append((pk, 'text', text))
+    rows.extend(
+        (pk, 'ingredients', name)
+        for pk, name in RecipeIngredient.objects.values_list(
+            'recipe_id', 'ingredient__name'
+        )
+    )
+    return RecipeIndex(rows, version)
+
+
+_recipe_index = None
+
+
+def get_recipe_index():
+    """Индекс, перечитываемый при смене версий рецептов и ингредиентов."""
+    global _recipe_index
+    version = [
+        token for token, _ in get_versions(
+            Recipes, RecipeIngredient, Ingredients
+        )
+    ]
+    if _recipe_index is None or _recipe_index.version != version:
+        _recipe_index = load_recipe_index(version)
+    return _recipe_index
+
+
+def search_recipes(queryset, query):
+    """
+    Полнотекстовый поиск рецептов по названию, ингредиентам и описанию.
+
+    На PostgreSQL — по search_vector с GIN-индексом из SEARCH_INDEXES
+    и ранжированием SearchRank, на остальных базах — по RecipeIndex,
+    не больше RECIPE_SEARCH_FALLBACK_LIMIT лучших совпадений.
+    Рецепты с равной релевантностью идут от новых к старым.
+    """
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(
+            query,
+            search_type='websearch',
+            config=settings.RECIPE_SEARCH_CONFIG
+        )
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-pub_date', '-id')
+    ids = get_recipe_index().search(query)
+    return order_by_ids(queryset, ids[:settings.RECIPE_SEARCH_FALLBACK_LIMIT])
@@ -0,0 +1,162 @@
+from django.db import connections, router, transaction
+from django.db.models import Sum
+
+from .models import RecipeIngredient, ShoppingListIngredient, WishList
+
+
+def get_amounts(recipe_id):
+    return list(RecipeIngredient.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('ingredient_id', 'amount'))
+
+
+# Строк в одном INSERT, чтобы не упереться в лимит параметров SQLite.
+BATCH_SIZE = 300
+
+
+def add_amounts(amounts):
+    """
+    Прибавляет {(user_id, ingredient_id): amount} одним INSERT ... ON
+    CONFLICT: строку, которую одновременно создаёт другой запрос,
+    select_for_update не заблокировал бы, и второй INSERT упал бы.
+    """
+    using = router.db_for_write(ShoppingListIngredient)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    meta = ShoppingListIngredient._meta
+    table = qn(meta.db_table)
+    user, ingredient, amount = (
+        qn(meta.get_field(name).column)
+        for name in ('user', 'ingredient', 'amount')
+    )
+    # Один порядок строк во всех запросах, чтобы не ловить взаимные
+    # блокировки.
+    rows = sorted(amounts.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), BATCH_SIZE):
+            batch = rows[start:start + BATCH_SIZE]
+            placeholders = ', '.join(['(%s, %s, %s)'] * len(batch))
+            cursor.execute(
+                f'INSERT INTO {table} ({user}, {ingredient}, {amount}) '
+                f'VALUES {placeholders} '
+                f'ON CONFLICT ({user}, {ingredient}) DO UPDATE '
+                f'SET {amount} = {table}.{amount} + EXCLUDED.{amount}',
+                [
+                    value
+                    for (user_id, ingredient_id), delta in batch
+                    for value in (user_id, ingredient_id, delta)
+                ]
+            )
+
+
+def subtract_amounts(amounts):
+    """
+    Вычитает {(user_id, ingredient_id): amount}, строки, количество
+    в которых стало нулевым, удаляются.
+    """
+    users = {user_id for user_id, _ in amounts}
+    ingredients = {ingredient_id for _, ingredient_id in amounts}
+    changed, removed = [], []
+    for row in ShoppingListIngredient.objects.select_for_update().filter(
+        user_id__in=users, ingredient_id__in=ingredients
+    ).order_by('pk'):
+        amount = amounts.get((row.user_id, row.ingredient_id))
+        if amount is None:
+            continue
+        if row.amount > amount:
+            row.amount -= amount
+            changed.append(row)
+        else:
+            removed.append(row.pk)
+    if removed:
+        ShoppingListIngredient.objects.filter(pk__in=removed).delete()
+    if changed:
+        ShoppingListIngredient.objects.bulk_update(changed, ['amount'])
+
+
+@transaction.atomic
+def apply_deltas(deltas):
+    """
+    Прибавляет к строкам списков покупок {(user_id, ingredient_id): delta}.
+
+    Строки, количество в которых стало нулевым, удаляются.
+    """
+    added = {key: delta for key, delta in deltas.items() if delta > 0}
+    subtracted = {key: -delta for key, delta in deltas.items() if delta < 0}
+    if added:
+        add_amounts(added)
+    if subtracted:
+        subtract_amounts(subtracted)
+
+
+def add_recipe(user_id, recipe_id, sign=1):
+    """Добавляет ингредиенты рецепта в список покупок или вычитает их."""
+    apply_deltas({
+        (user_id, ingredient_id): sign * amount
+        for ingredient_id, amount in get_amounts(recipe_id)
+    })
+
+
+def remove_recipe(recipe_id):
+    """Вычитает ингредиенты рецепта из списков всех, у кого он в корзине."""
+    users = WishList.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('user_id', flat=True)
+    amounts = get_amounts(recipe_id)
+    apply_deltas({
+        (user_id, ingredient_id): -amount
+        for user_id in users
+        for ingredient_id, amount in amounts
+    })
+
+
+@transaction.atomic
+def rebuild(users=None, ingredients=None):
+    """
+    Пересчитывает строки списков покупок по содержимому корзин.
+
+    Без аргументов пересобирает списки всех пользователей.
+    """
+    rows = ShoppingListIngredient.objects.all()
+    lookups = {'recipe__shopping_cart__isnull': False}
+    if users is not None:
+        rows = rows.filter(user_id__in=users)
+        lookups['recipe__shopping_cart__user_id__in'] = users
+    if ingredients is not None:
+        rows = rows.filter(ingredient_id__in=ingredients)
+        lookups['ingredient_id__in'] = ingredients
+    # Условия на корзину в одном filter(), чтобы JOIN был один.
+    totals = RecipeIngredient.objects.filter(**lookups)
+    rows.delete()
+    totals = totals.values_list(
+        'recipe__shopping_cart__user_id', 'ingredient_id'
+    ).annotate(total=Sum('amount')).order_by()
+    # Строку мог успеть создать add_amounts из другой транзакции,
+    # пересчитанная сумма её заменяет.
+    return len(ShoppingListIngredient.objects.bulk_create(
+        (
+            ShoppingListIngredient(
+                user_id=user_id, ingredient_id=ingredient_id, amount=total
+            )
+            for user_id, ingredient_id, total in totals.iterator()
+            if total > 0
+        ),
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['user', 'ingredient'],
+        update_fields=['amount']
+    ))
+
+
+def refresh_recipe(recipe_id, ingredients):
+    """
+    Пересчитывает ингредиенты рецепта у всех, у кого он в корзине.
+
+    Нужен при изменении состава рецепта, когда прежние количества
+    уже неизвестны.
+    """
+    users = list(WishList.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('user_id', flat=True))
+    if users and ingredients:
+        rebuild(users, list(ingredients))
@@ -0,0 +1,250 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_migrate,
+    post_save,
+    pre_delete
+)
+from django.dispatch import receiver
+
+from users.models import Subscription, User
+from .changes import FEED_KEY, touch, touch_keys
+from .images import is_stale, schedule_renditions
+from .models import (
+    Tags,
+    Ingredients,
+    Recipes,
+    RecipeIngredient,
+    Favorite,
+    WishList
+)
+from . import cookable, membership, shopping_list
+from .search import (
+    SEARCH_INDEXES,
+    TRIGRAM_INDEXES,
+    update_search_vectors
+)
+
+TRACKED_MODELS = (
+    Tags,
+    Ingredients,
+    Recipes,
+    RecipeIngredient,
+    Favorite,
+    WishList,
+    Subscription,
+    User
+)
+
+
+@receiver(post_migrate)
+def create_search_indexes(sender, using, **kwargs):
+    """Создаёт индексы для поиска ингредиентов и рецептов на PostgreSQL."""
+    if sender.name != 'recipes':
+        return
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for sql in TRIGRAM_INDEXES + SEARCH_INDEXES:
+            cursor.execute(sql)
+
+
+# Правка состава рецепта, которую вызывающий код учитывает сам,
+# см. bulk_ingredients.
+_bulk_ingredients = ContextVar('bulk_ingredients', default=False)
+
+
+@contextmanager
+def bulk_ingredients():
+    """
+    Блок, в котором приёмники удалений строк RecipeIngredient ничего
+    не делают: вызывающий код сам один раз пересчитывает рецепт
+    и списки покупок, а не по запросу на каждую строку.
+    """
+    token = _bulk_ingredients.set(True)
+    try:
+        yield
+    finally:
+        _bulk_ingredients.reset(token)
+
+
+def track_changes(sender, **kwargs):
+    """Меняет версию таблицы при любой записи в неё."""
+    touch(sender)
+
+
+# Только для своих моделей: приёмник post_delete отключает быстрое
+# каскадное удаление у модели, на которую подписан.
+for model in TRACKED_MODELS:
+    post_save.connect(track_changes, sender=model)
+    post_delete.connect(track_changes, sender=model)
+
+
+@receiver([post_save, post_delete], sender=Tags)
+@receiver([post_save, post_delete], sender=User)
+def track_object(sender, instance, **kwargs):
+    touch(sender, instance.pk)
+
+
+@receiver(post_delete, sender=Tags)
+def track_tag_delete(sender, **kwargs):
+    touch_keys(FEED_KEY)
+
+
+@receiver([post_save, post_delete], sender=Recipes)
+def track_recipe(sender, instance, created=True, **kwargs):
+    """
+    Новый или удалённый рецепт меняет состав ленты,
+    правка рецепта — только его самого.
+    """
+    touch(Recipes, instance.pk)
+    if created:
+        touch_keys(FEED_KEY)
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def track_recipe_ingredient(sender, instance, **kwargs):
+    if not _bulk_ingredients.get():
+        touch(Recipes, instance.recipe_id)
+
+
+@receiver(post_save, sender=Ingredients)
+def track_ingredient(sender, instance, **kwargs):
+    """Переименованный ингредиент меняет все рецепты с ним."""
+    touch(Recipes, *RecipeIngredient.objects.filter(
+        ingredient=instance
+    ).values_list('recipe_id', flat=True))
+
+
+@receiver(m2m_changed, sender=Recipes.tags.through)
+@receiver(m2m_changed, sender=Recipes.ingredients.through)
+def track_recipe_relations(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        touch(Recipes, *(pk_set or ()))
+    else:
+        touch(Recipes, instance.pk)
+    if sender is Recipes.tags.through:
+        touch_keys(FEED_KEY)
+
+
+def shift_counter(model, pk, field, delta):
+    """Атомарно меняет счётчик в строке, не опуская его ниже нуля."""
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=WishList)
+@receiver(post_save, sender=Recipes)
+def increment_counters(sender, instance, created, **kwargs):
+    if created:
+        update_counters(sender, instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=WishList)
+@receiver(post_delete, sender=Recipes)
+def decrement_counters(sender, instance, **kwargs):
+    update_counters(sender, instance, -1)
+
+
+def update_counters(sender, instance, delta):
+    if sender is Favorite:
+        shift_counter(Recipes, instance.recipe_id, 'favorites_count', delta)
+    elif sender is WishList:
+        shift_counter(
+            Recipes, instance.recipe_id, 'shopping_cart_count', delta
+        )
+    else:
+        shift_counter(User, instance.author_id, 'recipes_count', delta)
+
+
+@receiver(post_save, sender=Recipes)
+def update_renditions(sender, instance, **kwargs):
+    """Запускает пережатие, если у рецепта новое изображение."""
+    if is_stale(instance.image.name, instance.renditions):
+        schedule_renditions(instance)
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+@receiver([post_save, post_delete], sender=WishList)
+@receiver([post_save, post_delete], sender=Subscription)
+def invalidate_membership(sender, instance, **kwargs):
+    membership.invalidate(instance.user_id)
+
+
+def deleted_directly(origin, model):
+    """Удаление начато с model, а не каскадом от другой модели."""
+    return isinstance(origin, model) or getattr(origin, 'model', None) is model
+
+
+@receiver(post_save, sender=WishList)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        shopping_list.add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_delete, sender=WishList)
+def remove_from_shopping_list(sender, instance, origin=None, **kwargs):
+    """
+    При каскадном удалении рецепта его ингредиенты уже вычтены
+    в pre_delete, а при удалении пользователя список удаляется сам.
+    """
+    if deleted_directly(origin, WishList):
+        shopping_list.add_recipe(instance.user_id, instance.recipe_id, -1)
+
+
+@receiver(pre_delete, sender=Recipes)
+def remove_recipe_from_shopping_lists(sender, instance, **kwargs):
+    shopping_list.remove_recipe(instance.pk)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def refresh_shopping_lists(sender, instance, origin=None, **kwargs):
+    if _bulk_ingredients.get():
+        return
+    if origin is None or deleted_directly(origin, RecipeIngredient):
+        shopping_list.refresh_recipe(
+            instance.recipe_id, [instance.ingredient_id]
+        )
+
+
+@receiver(post_save, sender=Recipes)
+def update_recipe_search_vector(sender, instance, **kwargs):
+    update_search_vectors([instance.pk])
+
+
+@receiver(post_save, sender=Ingredients)
+def update_renamed_ingredient_search_vectors(sender, instance, created,
+                                             **kwargs):
+    if not created:
+        update_search_vectors(RecipeIngredient.objects.filter(
+            ingredient=instance
+        ).values('recipe_id'))
+
+
+@receiver(pre_delete, sender=Ingredients)
+def log_ingredient_delete(sender, instance, **kwargs):
+    """Строки состава удалятся каскадом, их сигналы журнал не ведут."""
+    recipe_ids = list(RecipeIngredient.objects.filter(
+        ingredient=instance
+    ).values_list('recipe_id', flat=True))
+    if recipe_ids:
+        cookable.log_changes(*recipe_ids)
+
+
+@receiver(post_delete, sender=Recipes)
+def log_recipe_delete(sender, instance, **kwargs):
+    cookable.log_changes(instance.pk)
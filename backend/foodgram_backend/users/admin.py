@@ -4,7 +4,13 @@ from .models import User, Subscription
 
 
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('username', 'first_name', 'last_name')
+    list_display = (
+        'username',
+        'first_name',
+        'last_name',
+        'recipes_count',
+        'followers_count'
+    )
     list_filter = ('username', 'email')
 
 
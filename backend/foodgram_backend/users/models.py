@@ -35,6 +35,16 @@ class User(AbstractUser):
         verbose_name='На меня подписаны',
         default=False
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Рецептов',
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Подписчиков',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -0,0 +1,23 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Subscription, User
+
+
+def shift_followers(author_id, delta):
+    User.objects.filter(pk=author_id).update(
+        followers_count=Greatest(F('followers_count') + delta, 0)
+    )
+
+
+@receiver(post_save, sender=Subscription)
+def increment_followers(sender, instance, created, **kwargs):
+    if created:
+        shift_followers(instance.author_id, 1)
+
+
+@receiver(post_delete, sender=Subscription)
+def decrement_followers(sender, instance, **kwargs):
+    shift_followers(instance.author_id, -1)